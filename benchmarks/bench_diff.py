@@ -0,0 +1,39 @@
+"""
+Times `director.diff.diff` (what `transform_to` runs when it is played) on
+10,000-line files, including the cases that make Myers' algorithm quadratic:
+
+    python benchmarks/bench_diff.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from director.diff import diff  # noqa: E402
+
+
+def cases(size=10000):
+    rng = random.Random(1)
+    lines = ['line {0} = {1}'.format(index, rng.random()) for index in range(size)]
+    other = ['other {0} = {1}'.format(index, rng.random()) for index in range(size)]
+    return [
+        ('one line edited', lines, lines[:size // 2] + ['edited'] + lines[size // 2 + 1:]),
+        ('every 10th line', lines, [line + '!' if index % 10 == 0 else line for index, line in enumerate(lines)]),
+        ('rotated by half', lines, lines[size // 2:] + lines[:size // 2]),
+        ('shuffled', lines, rng.sample(lines, size)),
+        ('unrelated', lines, other),
+    ]
+
+
+def main():
+    for name, a, b in cases():
+        started = time.perf_counter()
+        hunks = diff(a, b)
+        elapsed = time.perf_counter() - started
+        print('{0:16} {1:8.1f}ms  {2} hunks'.format(name, elapsed * 1000, len(hunks)))
+
+
+if __name__ == '__main__':
+    main()
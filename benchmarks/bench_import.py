@@ -0,0 +1,49 @@
+"""
+Measures how long the vendored pyyaml takes to import, each time in a fresh
+interpreter:
+
+    python benchmarks/bench_import.py [runs]
+
+"everything" is what `from . import pyyaml` used to cost when Sublime loaded
+the plugin: the loader, the dumper (emitter, serializer, representer) and the
+attempt to import the libyaml bindings.  Now the plugin imports nothing from
+pyyaml when it is loaded, and "loader only" when the first block is run.
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUPS = [
+    ('loader only', 'import pyyaml'),
+    ('everything', 'import pyyaml; pyyaml.Dumper; pyyaml.__with_libyaml__'),
+]
+
+SNIPPET = """
+import sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+{setup}
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def measure(setup, runs):
+    code = SNIPPET.format(root=ROOT, setup=setup)
+    times = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-S', '-c', code])
+        times.append(float(output))
+    return sorted(times)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    for name, setup in SETUPS:
+        times = measure(setup, runs)
+        print('{0:12} median {1:6.2f}ms  min {2:6.2f}ms'.format(name, times[runs // 2], times[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Counts and times every call the director makes into the Sublime API.
+
+`ViewProxy` wraps a `sublime.View` (and the `Selection` objects it returns) and
+reports every method call to an `ApiCallCounter`, which attributes the calls to
+the director command that is currently playing.  A "frame" is one timer tick:
+all the commands that ran in it, and the selection sync at its end.  If a frame
+makes more calls than the budget allows, it is counted as over budget.
+"""
+import time
+
+
+class ApiCallCounter(object):
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.reset()
+
+    def reset(self):
+        self.commands = {}
+        self.frames = {'frames': 0, 'calls': 0, 'max': 0, 'over_budget': 0}
+        self._current = None
+        self._command_calls = 0
+        self._frame_calls = None  # `None` outside of a frame
+
+    def begin_frame(self):
+        self._frame_calls = 0
+
+    def end_frame(self):
+        """
+        Closes the current frame.  Returns the number of API calls it made if
+        that exceeds the budget, otherwise `None`.
+        """
+        calls = self._frame_calls
+        self._frame_calls = None
+        if not calls:
+            return None
+        frames = self.frames
+        frames['frames'] += 1
+        frames['calls'] += calls
+        frames['max'] = max(frames['max'], calls)
+        if self.budget and calls > self.budget:
+            frames['over_budget'] += 1
+            return calls
+        return None
+
+    def begin(self, command):
+        self._current = self.commands.get(command)
+        if self._current is None:
+            self._current = self.commands[command] = {
+                'runs': 0, 'calls': 0, 'max': 0, 'api': {},
+            }
+        self._command_calls = 0
+
+    def end(self):
+        info = self._current
+        if info is None:
+            return
+        self._current = None
+        info['runs'] += 1
+        info['calls'] += self._command_calls
+        info['max'] = max(info['max'], self._command_calls)
+
+    def record(self, api, elapsed):
+        if self._frame_calls is not None:
+            self._frame_calls += 1
+        info = self._current
+        if info is None:
+            return
+        self._command_calls += 1
+        counts = info['api'].get(api)
+        if counts is None:
+            info['api'][api] = [1, elapsed]
+        else:
+            counts[0] += 1
+            counts[1] += elapsed
+
+    def report(self):
+        if not self.commands:
+            return ''
+        frames = self.frames
+        lines = ['API calls per frame (budget: {budget}): {avg:.1f} avg, {max} max, {over} over budget'.format(
+            budget=self.budget or 'none', avg=frames['calls'] / float(max(1, frames['frames'])),
+            max=frames['max'], over=frames['over_budget'])]
+        lines.append('API calls per command')
+        for name in sorted(self.commands, key=lambda name: -self.commands[name]['calls']):
+            info = self.commands[name]
+            runs = max(1, info['runs'])
+            lines.append('{name}: {avg:.1f} avg, {max} max'.format(
+                name=name, avg=info['calls'] / float(runs), max=info['max']))
+            for api, (count, elapsed) in sorted(info['api'].items(), key=lambda item: -item[1][0]):
+                lines.append('    {api}: {count} calls, {ms:.2f} ms'.format(
+                    api=api, count=count, ms=elapsed * 1000.0))
+        return '\n'.join(lines) + '\n'
+
+
+class _Proxy(object):
+    def __init__(self, wrapped, counter, prefix):
+        self._wrapped = wrapped
+        self._counter = counter
+        self._prefix = prefix
+
+    def _call(self, api, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._counter.record(self._prefix + api, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        attr = getattr(self._wrapped, name)
+        if not callable(attr):
+            return attr
+
+        def _counted(*args, **kwargs):
+            return self._call(name, attr, *args, **kwargs)
+        return _counted
+
+    def __bool__(self):
+        return True
+
+    def __eq__(self, other):
+        if isinstance(other, _Proxy):
+            other = other._wrapped
+        return self._wrapped == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._wrapped)
+
+
+class SelectionProxy(_Proxy):
+    def __init__(self, selection, counter):
+        super(SelectionProxy, self).__init__(selection, counter, 'sel().')
+
+    def __len__(self):
+        return self._call('__len__', self._wrapped.__len__)
+
+    def __getitem__(self, index):
+        return self._call('__getitem__', self._wrapped.__getitem__, index)
+
+    def __contains__(self, region):
+        return self._call('__contains__', self._wrapped.__contains__, region)
+
+    def __iter__(self):
+        return iter(self._call('__iter__', list, self._wrapped))
+
+
+class ViewProxy(_Proxy):
+    def __init__(self, view, counter):
+        super(ViewProxy, self).__init__(view, counter, '')
+
+    def __len__(self):
+        return self._call('__len__', self._wrapped.__len__)
+
+    def sel(self):
+        return SelectionProxy(self._call('sel', self._wrapped.sel), self._counter)
+
+    def window(self):
+        window = self._call('window', self._wrapped.window)
+        if window is None:
+            return None
+        return _Proxy(window, self._counter, 'window().')
@@ -0,0 +1,160 @@
+"""
+A local control channel, so that a foot pedal or a script on the same machine
+can drive the director.  The server listens on a loopback TCP port, or on a
+Unix socket, and reads newline-delimited JSON messages:
+
+    {"command": "run"}
+    {"command": "next"}
+    {"command": "previous"}
+    {"command": "seek", "offset": 2000}
+    {"command": "pause"}
+
+Every connection is served by its own thread, which only checks the message and
+hands it to `dispatch` (the plugin queues it on the main thread with
+`sublime.set_timeout`), then answers `{"ok": true}` or `{"error": "..."}`.
+Nothing here imports `sublime`, so the server can be tried out with `send` from
+a plain Python shell.
+"""
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+
+COMMANDS = ('run', 'next', 'previous', 'seek', 'pause')
+
+
+def check_message(message):
+    """
+    Returns what's wrong with `message`, or `None` if it can be dispatched.
+    """
+    if not isinstance(message, dict):
+        return 'expected a JSON object'
+    command = message.get('command')
+    if command not in COMMANDS:
+        return 'unknown command {command!r}, expected one of {commands}'.format(
+            command=command, commands=', '.join(COMMANDS))
+    if command == 'seek':
+        offset = message.get('offset')
+        if isinstance(offset, bool) or not isinstance(offset, (int, float)) or offset < 0:
+            return 'seek needs an "offset" in milliseconds (0 or more)'
+    return None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        socketserver.StreamRequestHandler.setup(self)
+        if self.server.address_family == socket.AF_INET:
+            # replies are tiny, don't let Nagle hold them back
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line.decode('utf-8'))
+            except ValueError as e:
+                reply = {'error': 'invalid JSON: {error}'.format(error=e)}
+            else:
+                error = check_message(message)
+                if error is None:
+                    self.server.dispatch(message)
+                    reply = {'ok': True}
+                else:
+                    reply = {'error': error}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:
+    _UnixServer = None
+
+
+class ControlServer(object):
+    """
+    Serves the control channel on `address`: a port number (on 127.0.0.1; 0
+    picks a free one) or the path of a Unix socket.  `dispatch(message)` is
+    called from the connection's thread for every valid message.
+    """
+    def __init__(self, address, dispatch):
+        if isinstance(address, int):
+            self._server = _TCPServer(('127.0.0.1', address), _Handler)
+        else:
+            assert _UnixServer is not None, 'Unix sockets are not available, use a port number'
+            _remove_socket(address)  # left over from a session that didn't stop cleanly
+            self._server = _UnixServer(address, _Handler)
+        self._server.dispatch = dispatch
+        self._thread = None
+
+    @property
+    def address(self):
+        """
+        The address that clients connect to, e.g. with `send`.
+        """
+        address = self._server.server_address
+        if isinstance(address, tuple):
+            return address[1]
+        return address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='ScreencastDirector control')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        address = self._server.server_address
+        if not isinstance(address, tuple):
+            _remove_socket(address)
+
+
+def _remove_socket(path):
+    """
+    Removes the Unix socket at `path`, but nothing else that may be there.
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def send(address, *messages, **kwargs):
+    """
+    A minimal client: sends `messages` (dicts) to the control server at
+    `address` and returns its replies.  Handy for testing a rig, e.g.
+
+        send(8421, {'command': 'next'}, {'command': 'run'})
+    """
+    timeout = kwargs.get('timeout', 5.0)
+    if isinstance(address, int):
+        connection = socket.create_connection(('127.0.0.1', address), timeout)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        connection.connect(address)
+    try:
+        connection.sendall(b''.join(json.dumps(message).encode('utf-8') + b'\n' for message in messages))
+        replies = []
+        reader = connection.makefile('rb')
+        for _ in messages:
+            replies.append(json.loads(reader.readline().decode('utf-8')))
+        reader.close()
+        return replies
+    finally:
+        connection.close()
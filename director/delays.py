@@ -0,0 +1,50 @@
+"""
+Random typing delays, drawn from a generator that can be seeded so that a take
+plays back with the same timing every time.  Delays for a whole `write` are
+drawn in one batch, using NumPy when it is importable (Sublime's own Python
+doesn't ship it) and `random` into an `array` otherwise.  The two paths draw
+different numbers for the same seed, so a seed is reproducible on one install,
+not across installs with and without NumPy.
+"""
+import random
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class DelayGenerator(object):
+    def __init__(self, seed=None):
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """
+        Restarts the generator.  With `seed=None` the delays are different on
+        every run.
+        """
+        self._random = random.Random(seed)
+        if numpy is not None:
+            self._numpy = numpy.random.RandomState(None if seed is None else seed % 2 ** 32)
+        else:
+            self._numpy = None
+
+    def randint(self, low, high):
+        """
+        One delay between `low` and `high`, inclusive.
+        """
+        return self._random.randint(low, high)
+
+    def batch(self, count, low, high):
+        """
+        `count` delays from `low` up to, but not including, `high` (or all
+        equal to `low` if `high <= low`), as a sequence of ints.
+        """
+        if high <= low:
+            return array('i', [low]) * count
+        if self._numpy is not None:
+            return self._numpy.randint(low, high, size=count).tolist()
+        span = high - low
+        next_random = self._random.random
+        return array('i', [low + int(next_random() * span) for _ in range(count)])
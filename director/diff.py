@@ -0,0 +1,219 @@
+"""
+A linear-space implementation of Myers' diff algorithm ("An O(ND) Difference
+Algorithm and Its Variations", 1986, section 4b): the edit graph is split at
+the "middle snake" of each box, and both halves are solved recursively, so only
+two `V` arrays are kept in memory instead of one per edit.
+
+`diff(a, b)` compares two sequences (usually lists of lines) and returns the
+changed ranges as `(a_start, a_end, b_start, b_end)` tuples, in order.
+
+The search for a middle snake is abandoned after `MAX_COST` edits, since Myers'
+algorithm is O(ND) and two unrelated files make D about N.  Such a box is split
+on the lines that occur exactly once in both of its halves, in the longest
+order-preserving run of them (as in patience diff), and the pieces are diffed
+in turn; a box without any such line is replaced as one hunk.
+"""
+import bisect
+
+# how far (in edits from either end) the middle snake of a box is looked for
+MAX_COST = 128
+
+
+def diff(a, b):
+    # common prefix and suffix are cheap to strip, and usually most of a file
+    prefix = 0
+    length = min(len(a), len(b))
+    while prefix < length and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    length -= prefix
+    while suffix < length and a[len(a) - 1 - suffix] == b[len(b) - 1 - suffix]:
+        suffix += 1
+    a_core = a[prefix:len(a) - suffix]
+    b_core = b[prefix:len(b) - suffix]
+
+    # compare small ints instead of (possibly long) strings
+    ids = {}
+    a_ids = [ids.setdefault(item, len(ids)) for item in a_core]
+    b_ids = [ids.setdefault(item, len(ids)) for item in b_core]
+
+    hunks = []
+    for a_start, a_end, b_start, b_end in _hunks(a_ids, b_ids):
+        hunks.append((a_start + prefix, a_end + prefix, b_start + prefix, b_end + prefix))
+    return hunks
+
+
+def _hunks(a, b):
+    """
+    Walks the path found by `_find_path`, and merges adjacent insertions and
+    deletions into hunks.
+    """
+    hunks = []
+    current = None
+    path = _find_path(a, b)
+    for (x1, y1), (x2, y2) in zip(path, path[1:]):
+        # a step and a snake, or a whole box that is replaced
+        while x1 < x2 and y1 < y2 and a[x1] == b[y1]:
+            x1 += 1
+            y1 += 1
+        while x1 < x2 and y1 < y2 and a[x2 - 1] == b[y2 - 1]:
+            x2 -= 1
+            y2 -= 1
+        if x1 != x2 or y1 != y2:
+            step = (x1, x2, y1, y2)
+            if current is not None and current[1] == step[0] and current[3] == step[2]:
+                current = (current[0], step[1], current[2], step[3])
+            else:
+                if current is not None:
+                    hunks.append(current)
+                current = step
+    if current is not None:
+        hunks.append(current)
+    return hunks
+
+
+def _find_path(a, b):
+    """
+    Returns the list of points that the edit path goes through.  Each box is
+    split at its middle snake, and the two smaller boxes before and after the
+    snake are solved the same way until they are empty.  An explicit stack is
+    used instead of recursion.  Boxes that are too expensive are split on their
+    unique lines instead, see `_anchors`.
+    """
+    path = []
+    stack = [_box_or_point((0, 0, len(a), len(b)), (0, 0))]
+    while stack:
+        kind, item = stack.pop()
+        if kind == 'point':
+            path.append(item)
+            continue
+
+        left, top, right, bottom = item
+        if left == right or top == bottom:
+            # only insertions or only deletions
+            stack.append(('point', (right, bottom)))
+            stack.append(('point', (left, top)))
+            continue
+        snake = _midpoint(a, b, left, top, right, bottom)
+        if snake is not None:
+            start, finish = snake
+            stack.append(_box_or_point((finish[0], finish[1], right, bottom), finish))
+            stack.append(_box_or_point((left, top, start[0], start[1]), start))
+            continue
+
+        anchors = _anchors(a, b, left, top, right, bottom)
+        if not anchors:
+            stack.append(('point', (right, bottom)))
+            stack.append(('point', (left, top)))
+            continue
+        # the boxes between the anchors, pushed last to first
+        x, y = right, bottom
+        for anchor_x, anchor_y in reversed(anchors):
+            stack.append(_box_or_point((anchor_x + 1, anchor_y + 1, x, y), (x, y)))
+            stack.append(('point', (anchor_x + 1, anchor_y + 1)))
+            stack.append(('point', (anchor_x, anchor_y)))
+            x, y = anchor_x, anchor_y
+        stack.append(_box_or_point((left, top, x, y), (left, top)))
+    return path
+
+
+def _anchors(a, b, left, top, right, bottom):
+    """
+    The `(x, y)` positions of the items that occur exactly once in
+    `a[left:right]` and once in `b[top:bottom]`, keeping the longest run of
+    them that is in the same order in both.
+    """
+    a_positions = {}
+    for x in range(left, right):
+        a_positions[a[x]] = x if a[x] not in a_positions else None
+    b_positions = {}
+    for y in range(top, bottom):
+        if a_positions.get(b[y]) is not None:
+            b_positions[b[y]] = y if b[y] not in b_positions else None
+    pairs = sorted((a_positions[item], y) for item, y in b_positions.items() if y is not None)
+
+    # longest increasing run of `y`, by patience sorting
+    tails = []  # y of the last pair of the best run of every length
+    tail_pairs = []
+    previous = {}
+    for x, y in pairs:
+        length = bisect.bisect_left(tails, y)
+        if length == len(tails):
+            tails.append(y)
+            tail_pairs.append((x, y))
+        else:
+            tails[length] = y
+            tail_pairs[length] = (x, y)
+        previous[(x, y)] = tail_pairs[length - 1] if length else None
+    run = []
+    pair = tail_pairs[-1] if tail_pairs else None
+    while pair is not None:
+        run.append(pair)
+        pair = previous[pair]
+    run.reverse()
+    return run
+
+
+def _box_or_point(box, point):
+    left, top, right, bottom = box
+    if right - left + bottom - top:
+        return ('box', box)
+    return ('point', point)
+
+
+def _midpoint(a, b, left, top, right, bottom):
+    """
+    The start and end of the middle snake of the box, or `None` if it is more
+    than `MAX_COST` edits from either end.
+    """
+    width = right - left
+    height = bottom - top
+    size = width + height
+    if size == 0:
+        return None
+    delta = width - height
+    odd = size % 2 == 1
+    limit = (size + 1) // 2
+    if limit > MAX_COST:
+        # the V arrays are indexed from -limit, and only ever reach -MAX_COST
+        limit = MAX_COST
+    vf = [0] * (2 * limit + 2)
+    vb = [0] * (2 * limit + 2)
+    vf[1] = left
+    vb[1] = bottom
+
+    for d in range(limit + 1):
+        # forward
+        for k in range(d, -d - 1, -2):
+            c = k - delta
+            if k == -d or (k != d and vf[k - 1] < vf[k + 1]):
+                px = x = vf[k + 1]
+            else:
+                px = vf[k - 1]
+                x = px + 1
+            y = top + (x - left) - k
+            py = y if (d == 0 or x != px) else y - 1
+            while x < right and y < bottom and a[x] == b[y]:
+                x += 1
+                y += 1
+            vf[k] = x
+            if odd and -(d - 1) <= c <= d - 1 and y >= vb[c]:
+                return (px, py), (x, y)
+
+        # backward
+        for c in range(d, -d - 1, -2):
+            k = c + delta
+            if c == -d or (c != d and vb[c - 1] > vb[c + 1]):
+                py = y = vb[c + 1]
+            else:
+                py = vb[c - 1]
+                y = py - 1
+            x = left + (y - top) + k
+            px = x if (d == 0 or y != py) else x + 1
+            while x > left and y > top and a[x - 1] == b[y - 1]:
+                x -= 1
+                y -= 1
+            vb[c] = y
+            if not odd and -d <= k <= d and x <= vf[k]:
+                return (x, y), (px, py)
+    return None
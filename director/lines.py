@@ -0,0 +1,122 @@
+"""
+An index of where every line of the target view starts, so that row-based
+commands (`select_lines`, `clear_lines`, `insert_at`...) can turn rows into
+points, and count rows from the end of the buffer, without asking the view:
+`rowcol` and `text_point` scan the buffer's lines on every call.
+
+The line starts are kept like the marks (see `director.marks`): a plain sorted
+list plus an `OffsetTree` of how far each one has moved.  An edit that doesn't
+add or remove a newline only shifts the lines after it, in O(log n); one that
+does splices the list.  Edits are not applied right away: they are logged, with
+consecutive typing merged into one entry, and applied the next time the index
+is queried, so a `write` that types twenty lines splices the list once.
+"""
+import re
+
+from .offsets import OffsetTree
+
+NEWLINE = re.compile('\n')
+
+
+class LineIndex(object):
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        The buffer changed in some unknown way; rebuild on the next query.
+        """
+        self._starts = None
+        self._offsets = None
+        self._size = 0
+        self.pending = []  # [begin, end, [text, ...], length] edits that haven't been applied
+
+    def edit(self, begin, end, text):
+        """
+        Records that the text between `begin` and `end` was replaced by `text`.
+        """
+        if self._starts is None:
+            return
+        if self.pending and begin == end:
+            last = self.pending[-1]
+            if begin == last[0] + last[3]:
+                # typing: extend the previous insertion
+                last[2].append(text)
+                last[3] += len(text)
+                return
+        self.pending.append([begin, end, [text], len(text)])
+
+    def load(self, read):
+        """
+        Brings the index up to date and returns it.  `read()` returns the whole
+        buffer; it is only called when the index has to be built.
+        """
+        if self._starts is None:
+            text = read()
+            self._starts = [0] + [match.end() for match in NEWLINE.finditer(text)]
+            self._offsets = OffsetTree(len(self._starts))
+            self._size = len(text)
+            self.pending = []
+        elif self.pending:
+            for begin, end, text, _ in self.pending:
+                self._apply(begin, end, ''.join(text))
+            self.pending = []
+        return self
+
+    def _apply(self, begin, end, text):
+        delta = len(text) - (end - begin)
+        # the lines that start inside the replaced text are gone
+        first = self._first_after(begin)
+        after = self._first_after(end, first)
+        added = [begin + match.end() for match in NEWLINE.finditer(text)]
+        if first == after and not added:
+            self._offsets.add(after, len(self._starts), delta)
+        else:
+            starts = self._positions()
+            starts[first:] = added + [start + delta for start in starts[after:]]
+            self._starts = starts
+            self._offsets = OffsetTree(len(starts))
+        self._size += delta
+
+    def _positions(self):
+        return [start + offset for start, offset in zip(self._starts, self._offsets.values())]
+
+    def _first_after(self, point, low=0):
+        # the first line that starts after `point`
+        high = len(self._starts)
+        while low < high:
+            middle = (low + high) // 2
+            if self.start(middle) > point:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def __len__(self):
+        """
+        The number of lines (a buffer that ends with a newline has an empty
+        last line).
+        """
+        return len(self._starts)
+
+    def start(self, row):
+        return self._starts[row] + self._offsets.get(row)
+
+    def end(self, row):
+        """
+        Where `row` ends, not counting its newline.
+        """
+        if row + 1 < len(self._starts):
+            return self.start(row + 1) - 1
+        return self._size
+
+    def full_end(self, row):
+        """
+        Where `row` ends, counting its newline.
+        """
+        if row + 1 < len(self._starts):
+            return self.start(row + 1)
+        return self._size
+
+    def row(self, point):
+        return self._first_after(point) - 1
@@ -0,0 +1,96 @@
+"""
+Named positions in the target view that follow the director's edits.
+
+The marks are kept sorted by position (edits never change their order), as a
+plain list of positions plus an `OffsetTree` of how far each one has moved
+since the list was last rebuilt.  An edit is a binary search and a range add,
+O(log n) no matter how many marks there are; adding or removing a mark rebuilds
+the list, which is O(n) but rare.
+"""
+from .offsets import OffsetTree
+
+
+class MarkTable(object):
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._names = []
+        self._positions = []
+        self._offsets = OffsetTree(0)
+        self._index = {}
+        self.dirty = True  # the view's copy of the marks is out of date
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def _position(self, index):
+        return self._positions[index] + self._offsets.get(index)
+
+    def positions(self):
+        return [self._position(index) for index in range(len(self._names))]
+
+    def get(self, name, default=None):
+        index = self._index.get(name)
+        if index is None:
+            return default
+        return self._position(index)
+
+    def set(self, name, position):
+        marks = [(self._position(index), mark_name) for index, mark_name in enumerate(self._names) if mark_name != name]
+        marks.append((position, name))
+        self._rebuild(marks)
+
+    def load(self, positions):
+        """
+        Replaces every mark's position, in order.  Used to pick up the positions
+        from the view after someone else edited it; ignored if the number of
+        positions doesn't match.
+        """
+        if len(positions) == len(self._names):
+            self._rebuild(zip(positions, self._names))
+            self.dirty = False
+
+    def _rebuild(self, marks):
+        marks = sorted(marks, key=lambda mark: mark[0])
+        self._positions = [position for position, _ in marks]
+        self._names = [name for _, name in marks]
+        self._index = dict((name, index) for index, name in enumerate(self._names))
+        self._offsets = OffsetTree(len(self._names))
+        self.dirty = True
+
+    def _first_after(self, point, inclusive=False):
+        # the first mark whose position is > point (>= point if inclusive)
+        low, high = 0, len(self._names)
+        while low < high:
+            middle = (low + high) // 2
+            position = self._position(middle)
+            if position > point or (inclusive and position == point):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def edit(self, begin, end, length):
+        """
+        The text between `begin` and `end` was replaced with `length`
+        characters.  Marks at `begin` stay put, marks inside the replaced text
+        move to `begin`, and marks after it move by the difference in length.
+        """
+        if not self._names:
+            return
+        first = self._first_after(begin)
+        if first > 0 and length and self._position(first - 1) == begin:
+            # the view pushes regions forward when text is inserted at them
+            self.dirty = True
+        if first == len(self._names):
+            return
+        after = max(first, self._first_after(end, inclusive=True))
+        if after > first:
+            self.dirty = True
+        for index in range(first, after):
+            self._offsets.add(index, index + 1, begin - self._position(index))
+        self._offsets.add(after, len(self._names), length - (end - begin))
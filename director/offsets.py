@@ -0,0 +1,51 @@
+"""
+`OffsetTree` is a Fenwick (binary indexed) tree over a fixed number of slots
+that supports adding a value to a range of slots and reading the total added to
+one slot, both in O(log n).  It is used to shift many positions at once: the
+positions themselves are stored as a plain sorted list, and the tree holds how
+far each one has moved since.
+"""
+
+
+class OffsetTree(object):
+    def __init__(self, size):
+        self.size = size
+        self._tree = [0] * (size + 1)
+
+    def _add(self, index, value):
+        index += 1
+        while index <= self.size:
+            self._tree[index] += value
+            index += index & -index
+
+    def add(self, start, stop, value):
+        """
+        Adds `value` to every slot in `range(start, stop)`.
+        """
+        if start >= stop or not value:
+            return
+        self._add(start, value)
+        if stop < self.size:
+            self._add(stop, -value)
+
+    def get(self, index):
+        """
+        The total that has been added to slot `index`.
+        """
+        total = 0
+        index += 1
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def values(self):
+        """
+        The total that has been added to every slot, in O(n) rather than n
+        calls to `get`.
+        """
+        tree = self._tree
+        totals = [0] * (self.size + 1)
+        for index in range(1, self.size + 1):
+            totals[index] = tree[index] + totals[index - (index & -index)]
+        return totals[1:]
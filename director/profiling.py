@@ -0,0 +1,71 @@
+"""
+Profiles one take: a `cProfile` profile of the block's compile and playback,
+and the lines that allocated the most memory while it played, from
+`tracemalloc` (Python 3.4 and later; Sublime Text 3's Python 3.3 only gets the
+profile).
+
+The profiler is only switched on while the director's own code runs (compiling
+the block, and every timer tick), so the time between ticks isn't counted.
+When profiling is off the director doesn't create a `TakeProfile` at all.
+"""
+import cProfile
+import pstats
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class TakeProfile(object):
+    def __init__(self, top=25):
+        self.top = top
+        self.profile = cProfile.Profile()
+        self._depth = 0
+        self._started_tracemalloc = False
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def enable(self):
+        # calls can nest (e.g. a tick that runs a command), only the outermost
+        # one switches the profiler
+        if not self._depth:
+            self.profile.enable()
+        self._depth += 1
+
+    def disable(self):
+        self._depth -= 1
+        if not self._depth:
+            self.profile.disable()
+
+    def dump(self, path):
+        """
+        Writes the profile to `path` + ".prof" (open it with `pstats` or
+        snakeviz), a summary of the slowest calls to `path` + ".txt", and the
+        `top` biggest allocations to `path` + "-memory.txt".  Returns the paths
+        that were written.
+        """
+        snapshot = None
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            # before writing the reports, which allocate too
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, cProfile.__file__),
+                ))
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+        paths = [path + '.prof', path + '.txt']
+        self.profile.dump_stats(paths[0])
+        with open(paths[1], 'w') as f:
+            stats = pstats.Stats(self.profile, stream=f)
+            stats.sort_stats('cumulative').print_stats(self.top)
+
+        if snapshot is not None:
+            paths.append(path + '-memory.txt')
+            with open(paths[2], 'w') as f:
+                f.write('Top {top} allocations by line\n\n'.format(top=self.top))
+                for statistic in snapshot.statistics('lineno')[:self.top]:
+                    f.write('{statistic}\n'.format(statistic=statistic))
+        return paths
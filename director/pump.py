@@ -0,0 +1,72 @@
+"""
+One timer for every director session.  Each session keeps its own queue and
+schedule (see `ScreencastDirector._tick`); the pump keeps a single
+`set_timeout` chain, and on every tick gives each session that is due a turn,
+all within one frame budget.  N sessions playing at once cost one callback per
+frame instead of N.  A session whose `_tick` raises is told to `_abort` its
+take and dropped, without holding up the others.
+"""
+import time
+import traceback
+
+
+class TimerPump(object):
+    def __init__(self, set_timeout, frame_budget=0.016):
+        self.set_timeout = set_timeout
+        self.frame_budget = frame_budget
+        self.sessions = []
+        self._due = None  # when the pending timer fires, or None
+        self._generation = 0
+
+    def wake(self, session, due=None):
+        """
+        Adds `session` to the sessions that are playing, and makes sure that a
+        tick happens by `due` (default: now).
+        """
+        if session not in self.sessions:
+            self.sessions.append(session)
+        if due is None:
+            due = time.perf_counter()
+        self._schedule(due)
+
+    def remove(self, session):
+        if session in self.sessions:
+            self.sessions.remove(session)
+
+    def _schedule(self, due):
+        if self._due is not None and self._due <= due:
+            return  # the pending timer fires soon enough
+        # a timer can't be cancelled, so an earlier one supersedes it instead
+        self._due = due
+        self._generation += 1
+        generation = self._generation
+        wait = max(0, int(round((due - time.perf_counter()) * 1000)))
+        self.set_timeout(lambda: self._tick(generation), wait)
+
+    def _tick(self, generation):
+        if generation != self._generation:
+            return
+        self._due = None
+        frame_start = time.perf_counter()
+        deadline = frame_start + self.frame_budget
+        sessions = self.sessions
+        if len(sessions) > 1:
+            # take turns at going first, so a busy session can't starve the others
+            sessions.append(sessions.pop(0))
+
+        next_due = None
+        for session in list(sessions):
+            try:
+                due = session._tick(frame_start, deadline)
+            except Exception:
+                # a broken take stops, the other sessions play on
+                print('ScreencastDirector: playback stopped by an error')
+                traceback.print_exc()
+                session._abort()
+                due = None
+            if due is None:
+                sessions.remove(session)
+            elif next_due is None or due < next_due:
+                next_due = due
+        if next_due is not None:
+            self._schedule(next_due)
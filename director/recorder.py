@@ -0,0 +1,190 @@
+"""
+Record mode: captures edits and cursor moves in a view, and turns them into
+director commands.
+
+Capturing has to keep up with typing, so `Recorder.modified` and
+`Recorder.selected` only compare the new size and selection of the view with
+the previous ones and append a tuple to a ring buffer (a `deque` with a
+`maxlen`, so a forgotten recording can't eat all the memory).  Turning the
+events into commands (`compact`) is done later, off the UI thread.
+
+Events are `(kind, time, ...)` tuples, `time` in seconds:
+
+* `('replace', time, selected, text)`: the selection (`selected` characters
+  long) was replaced by `text`, which covers typing, pasting and deleting a
+  selection,
+* `('backspace', time, count)` and `('forward_delete', time, count)`,
+* `('select', time, a, b)`: the selection moved to `(a, b)`,
+* `('snapshot', time, text, a, b)`: an edit we can't describe (undo, several
+  cursors...), so the whole text is kept.
+
+Auto-closed brackets and quotes are recorded as typing plus a cursor move (and
+deleting a pair as a backspace plus a forward delete), not as snapshots.
+"""
+from collections import deque
+
+# default size of the ring buffer, in events
+CAPACITY = 100000
+# pauses longer than this (in milliseconds) become `delay` commands
+PAUSE = 500
+
+
+class Recorder(object):
+    def __init__(self, size, selection, started, capacity=CAPACITY):
+        self.events = deque(maxlen=capacity)
+        self.size = size
+        self.selection = selection  # (a, b) of the first selection
+        self.start = selection
+        self.started = started
+
+    def modified(self, now, size, selection, substr):
+        """
+        The view changed: it is now `size` characters long, and its first
+        selection is `selection`.  `substr(begin, end)` reads the view, and is
+        only called for the text that was typed (or for a snapshot).
+        """
+        old_begin, old_end = sorted(self.selection)
+        begin, end = selection
+        delta = size - self.size
+        selected = old_end - old_begin
+        if begin == end and begin >= old_begin and begin - old_begin == selected + delta and (selected or delta):
+            self.events.append(('replace', now, selected, substr(old_begin, begin)))
+        elif begin == end and not selected and delta < 0 and begin == old_begin + delta:
+            self.events.append(('backspace', now, -delta))
+        elif begin == end and not selected and delta < 0 and begin == old_begin:
+            self.events.append(('forward_delete', now, -delta))
+        elif begin == end and not selected and old_begin < begin < old_begin + delta:
+            # typing that also inserted text after the caret, e.g. a closing
+            # bracket
+            self.events.append(('replace', now, 0, substr(old_begin, old_begin + delta)))
+            self.events.append(('select', now, begin, end))
+        elif begin == end and not selected and begin < old_begin < begin - delta:
+            # deleting on both sides of the caret, e.g. a pair of brackets
+            self.events.append(('backspace', now, old_begin - begin))
+            self.events.append(('forward_delete', now, begin - delta - old_begin))
+        else:
+            self.events.append(('snapshot', now, substr(0, size), selection[0], selection[1]))
+        self.size = size
+        self.selection = selection
+
+    def selected(self, now, selection):
+        """
+        The selection changed.  Selection changes that come with an edit are
+        ignored, `modified` has already recorded them.
+        """
+        if selection != self.selection:
+            self.events.append(('select', now, selection[0], selection[1]))
+            self.selection = selection
+
+
+def compact(events, start, pause=PAUSE):
+    """
+    Turns recorded `events` into a list of director entries (as they would be
+    parsed from YAML).  `start` is the selection when recording started;
+    cursor moves are written relative to it, so the script can be played from
+    anywhere.  Runs of typing are merged into one `write` whose `delay_min`
+    and `delay_max` come from the recorded typing speed, and consecutive cursor
+    moves into one.
+    """
+    entries = []
+    typed = []
+    gaps = []
+    cursor = start
+    moved_to = None
+    previous = None
+
+    def flush_typing():
+        if typed:
+            entries.append(_write_entry(''.join(typed), gaps))
+            del typed[:]
+            del gaps[:]
+
+    def flush_move():
+        if moved_to is not None and moved_to != cursor:
+            flush_typing()
+            entries.extend(_move_entries(cursor, moved_to))
+            return moved_to
+        return cursor
+
+    for event in events:
+        kind, time = event[0], event[1]
+        gap = None if previous is None else int(round((time - previous) * 1000))
+        previous = time
+        if gap is not None and gap > pause:
+            cursor = flush_move()
+            moved_to = None
+            flush_typing()
+            entries.append({'delay': gap})
+            gap = None
+
+        if kind == 'select':
+            moved_to = (event[2], event[3])
+            continue
+        cursor = flush_move()
+        moved_to = None
+
+        if kind == 'replace':
+            selected, text = event[2], event[3]
+            begin = min(cursor)
+            if selected or not text:
+                # typing over (or deleting) a selection
+                flush_typing()
+                entries.append(_write_entry(text, []) if text else 'delete')
+            else:
+                if typed and gap is not None:
+                    gaps.append(gap)
+                typed.append(text)
+            cursor = (begin + len(text), begin + len(text))
+        elif kind in ('backspace', 'forward_delete'):
+            flush_typing()
+            count = event[2]
+            if kind == 'backspace':
+                entries.append({'select_delta': -count})
+                cursor = (cursor[0] - count, cursor[0] - count)
+            else:
+                entries.append({'select_delta': count})
+            entries.append('delete')
+        elif kind == 'snapshot':
+            flush_typing()
+            entries.append({'transform_to': {'text': event[2], 'typing': False}})
+            entries.append('select_all')
+            entries.extend(_move_entries((0, len(event[2])), (event[3], event[4])))
+            cursor = (event[3], event[4])
+    flush_move()
+    flush_typing()
+    return entries
+
+
+def _move_entries(cursor, selection):
+    """
+    `go` (and `select_delta`) entries that move the director's cursor from
+    `cursor` to `selection`.
+    """
+    a, b = selection
+    entries = []
+    if a != min(cursor) or cursor[0] != cursor[1]:
+        # `go` also collapses a selection, which `select_delta` would extend
+        entries.append({'go': a - min(cursor)})
+    if b != a:
+        entries.append({'select_delta': b - a})
+    return entries
+
+
+def _write_entry(text, gaps):
+    text = '\n'.join(_protect(line) for line in text.split('\n'))
+    if not gaps:
+        return {'write': text}
+    gaps = sorted(gaps)
+    delay_min = gaps[len(gaps) // 10]
+    delay_max = max(delay_min + 1, gaps[len(gaps) * 9 // 10])
+    return {'write': {'write': text, 'delay_min': delay_min, 'delay_max': delay_max}}
+
+
+def _protect(line):
+    """
+    `write` evaluates lines that are wrapped in double quotes, so a typed line
+    like that is quoted once more.
+    """
+    if len(line) > 1 and line[0] == '"' and line[-1] == '"':
+        return '"' + line.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return line
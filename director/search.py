@@ -0,0 +1,140 @@
+"""
+An index of where a fixed set of literal patterns occur in a buffer, so that
+`select_next`, `select_nth` and `replace_all` don't have to rescan the view
+every time they run.
+
+All patterns are found in one pass: a single regular expression of the form
+`(?=(longest|...|shortest))` reports the longest pattern at every position, and
+every shorter pattern that is a prefix of it must occur there too.
+
+Edits are not applied right away; they are appended to a log (merging
+consecutive typing into one entry) and applied the next time the index is
+queried, by dropping the matches that touch an edit, shifting the ones after
+it, and rescanning only the text around the edits.
+"""
+import bisect
+import re
+
+
+class MultiPatternMatcher(object):
+    def __init__(self, patterns):
+        self.patterns = sorted(set(pattern for pattern in patterns if pattern), key=lambda pattern: (-len(pattern), pattern))
+        self.longest = len(self.patterns[0]) if self.patterns else 0
+        # for every pattern, the (shorter) patterns that are a prefix of it
+        self.prefixes = dict(
+            (pattern, [other for other in self.patterns if len(other) < len(pattern) and pattern.startswith(other)])
+            for pattern in self.patterns
+            )
+        if self.patterns:
+            self.regex = re.compile('(?=(' + '|'.join(re.escape(pattern) for pattern in self.patterns) + '))')
+        else:
+            self.regex = None
+
+    def scan(self, text, offset=0):
+        """
+        Returns `{pattern: [position, ...]}` for every occurrence (overlapping
+        ones included) of every pattern in `text`.  Positions are shifted by
+        `offset`.
+        """
+        found = dict((pattern, []) for pattern in self.patterns)
+        if self.regex is None:
+            return found
+        for match in self.regex.finditer(text):
+            position = match.start() + offset
+            pattern = match.group(1)
+            found[pattern].append(position)
+            for prefix in self.prefixes[pattern]:
+                found[prefix].append(position)
+        return found
+
+
+class OccurrenceIndex(object):
+    def __init__(self, patterns=()):
+        self.matcher = MultiPatternMatcher(patterns)
+        self.positions = None  # {pattern: sorted positions}, None until built
+        self.pending = []  # (begin, end, length) edits that haven't been applied
+        self.dirty = []  # (begin, end) ranges, in current coordinates, to rescan
+
+    def add_pattern(self, pattern):
+        if pattern and pattern not in self.matcher.prefixes:
+            self.matcher = MultiPatternMatcher(self.matcher.patterns + [pattern])
+            self.invalidate()
+
+    def invalidate(self):
+        """
+        The buffer changed in some unknown way; rebuild on the next query.
+        """
+        self.positions = None
+        self.pending = []
+        self.dirty = []
+
+    def edit(self, begin, end, length):
+        """
+        Records that the text between `begin` and `end` was replaced by `length`
+        characters.
+        """
+        if self.positions is None:
+            return
+        if self.pending:
+            last_begin, last_end, last_length = self.pending[-1]
+            if begin == last_begin + last_length and end == begin:
+                # typing: extend the previous insertion
+                self.pending[-1] = (last_begin, last_end, last_length + length)
+                return
+        self.pending.append((begin, end, length))
+
+    def occurrences(self, pattern, substr, size):
+        """
+        The sorted start positions of `pattern`.  `substr(begin, end)` and
+        `size()` read the buffer; the whole buffer is only read when the index
+        is built, after that only the text around edits is.
+        """
+        self.add_pattern(pattern)
+        if self.positions is None:
+            self.positions = self.matcher.scan(substr(0, size()))
+        elif self.pending:
+            self._apply_pending(substr, size)
+        return self.positions[pattern]
+
+    def _apply_pending(self, substr, size):
+        longest = self.matcher.longest
+        for begin, end, length in self.pending:
+            delta = length - (end - begin)
+            for pattern, positions in self.positions.items():
+                # matches that start in (begin - len(pattern), end) touch the edit
+                low = bisect.bisect_right(positions, begin - len(pattern))
+                high = bisect.bisect_left(positions, end)
+                if begin == end:
+                    # an insertion only breaks the matches that span it
+                    high = bisect.bisect_left(positions, begin)
+                positions[low:] = [position + delta for position in positions[high:]]
+            self.dirty = [(_shift(a, begin, end, delta), _shift(b, begin, end, delta)) for a, b in self.dirty]
+            self.dirty.append((begin, begin + length))
+        self.pending = []
+
+        buffer_size = size()
+        windows = []
+        for a, b in sorted(self.dirty):
+            a = max(0, a - longest + 1)
+            b = min(buffer_size, b + longest - 1)
+            if windows and a <= windows[-1][1]:
+                windows[-1] = (windows[-1][0], max(windows[-1][1], b))
+            else:
+                windows.append((a, b))
+        self.dirty = []
+
+        for a, b in windows:
+            found = self.matcher.scan(substr(a, b), a)
+            for pattern, positions in self.positions.items():
+                # replace every match that lies inside the window
+                low = bisect.bisect_left(positions, a)
+                high = bisect.bisect_right(positions, b - len(pattern))
+                positions[low:high] = found[pattern]
+
+
+def _shift(point, begin, end, delta):
+    if point <= begin:
+        return point
+    if point >= end:
+        return point + delta
+    return begin
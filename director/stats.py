@@ -0,0 +1,107 @@
+"""
+Cheap, always-on playback counters.  Every director command name gets a
+`CommandStats` entry with an invocation count, total time, and two fixed-size
+log-bucket histograms (execution time and scheduling error), so memory use
+never grows no matter how long a take runs.
+"""
+import math
+
+
+class LogHistogram(object):
+    """
+    A histogram of millisecond values in geometrically growing buckets.  With
+    the defaults, bucket boundaries grow by 2**(1/4) (~19%) from 0.01ms up to
+    ~100s, which is plenty of resolution for a p50/p99 readout.
+    """
+    def __init__(self, smallest=0.01, ratio=2 ** 0.25, size=96):
+        self.smallest = smallest
+        self.ratio = ratio
+        self._log_ratio = math.log(ratio)
+        self.buckets = [0] * size
+        self.count = 0
+
+    def bucket_index(self, value):
+        if value <= self.smallest:
+            return 0
+        index = int(math.log(value / self.smallest) / self._log_ratio) + 1
+        return min(index, len(self.buckets) - 1)
+
+    def upper_bound(self, index):
+        return self.smallest * self.ratio ** index
+
+    def add(self, value):
+        self.buckets[self.bucket_index(value)] += 1
+        self.count += 1
+
+    def percentile(self, pct):
+        """
+        Returns the upper bound of the bucket that contains the `pct`
+        percentile, or `0` if nothing has been recorded.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(self.count * pct / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return self.upper_bound(index)
+        return self.upper_bound(len(self.buckets) - 1)
+
+
+class CommandStats(object):
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.elapsed = LogHistogram()
+        self.error = LogHistogram()
+
+    def record(self, elapsed, error=None):
+        self.count += 1
+        self.total += elapsed
+        self.elapsed.add(elapsed)
+        if error is not None:
+            self.error.add(abs(error))
+
+
+class StatsTable(object):
+    """
+    Maps a command name to its `CommandStats`.  `record` is called once per
+    played command, `report` renders a plain-text table.
+    """
+    def __init__(self):
+        self.commands = {}
+
+    def record(self, name, elapsed, error=None):
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        stats.record(elapsed, error)
+
+    def reset(self):
+        self.commands = {}
+
+    def report(self):
+        if not self.commands:
+            return 'No commands have been played yet.\n'
+
+        header = ('command', 'count', 'total ms', 'p50 ms', 'p99 ms', 'err p50', 'err p99')
+        rows = [header]
+        for name in sorted(self.commands, key=lambda name: -self.commands[name].total):
+            stats = self.commands[name]
+            rows.append((
+                name,
+                str(stats.count),
+                '%.1f' % stats.total,
+                '%.2f' % stats.elapsed.percentile(50),
+                '%.2f' % stats.elapsed.percentile(99),
+                '%.1f' % stats.error.percentile(50),
+                '%.1f' % stats.error.percentile(99),
+                ))
+        widths = [max(len(row[col]) for row in rows) for col in range(len(header))]
+        lines = []
+        for row in rows:
+            cells = [row[0].ljust(widths[0])]
+            cells.extend(cell.rjust(width) for cell, width in zip(row[1:], widths[1:]))
+            lines.append('  '.join(cells))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,163 @@
+"""
+Reusable, compiled pieces of a take.  A `Fragment` is a list of queue entries
+(`(command, delay)` tuples) that was compiled once, from an included block or
+a macro call.  The queue refers to a fragment with a single entry, and the
+fragment's commands are spliced in when playback reaches it, so a block that
+calls the same macro fifty times holds fifty references, not fifty copies.
+
+Commands are only shared if they don't keep state between plays, and don't
+depend on anything that may change between them except the target view, which
+they read when they are played.  Commands that do are marked with a `stateful`
+attribute (e.g. `write_lines`, which remembers its rows from one column to the
+next, or `transform_to` with a file), and a fragment that contains one
+(directly, or in a nested fragment) is compiled again every time.
+
+A `Loop` plays a fragment a number of times.  It stays one entry on the queue,
+which puts one copy of the body in front of itself (with one less to go) when
+playback reaches it.  `duration` works out how long commands take from the
+loop count, without unrolling it.
+"""
+
+
+class Fragment(object):
+    __slots__ = ('commands', 'stateful', '_duration')
+
+    def __init__(self, commands):
+        self.commands = commands
+        self.stateful = any(is_stateful(command) for command, _ in commands)
+        self._duration = None
+
+    def __len__(self):
+        return len(self.commands)
+
+    @property
+    def duration(self):
+        if self._duration is None:
+            self._duration = duration(self.commands)
+        return self._duration
+
+
+class Loop(object):
+    """
+    `times` plays of the commands that `compile()` returns.  The body is
+    compiled once, or for every play if it is stateful.
+    """
+    __slots__ = ('times', 'compile', 'body')
+
+    def __init__(self, times, compile):
+        self.times = times
+        self.compile = compile
+        self.body = Fragment(compile())
+
+    def next_body(self):
+        body = self.body
+        if body.stateful:
+            self.body = Fragment(self.compile())
+        return body
+
+
+def fragment_entry(fragment):
+    """
+    The queue entry that plays `fragment`.  It is never run as an edit, the
+    director splices the fragment's commands in its place.
+    """
+    def _play_fragment(cursor, edit):
+        return cursor
+    _play_fragment.fragment = fragment
+    _play_fragment.expands = True
+    return (_play_fragment, 0)
+
+
+def loop_entry(loop, times):
+    """
+    The queue entry that plays `loop` `times` more times.
+    """
+    def _play_loop(cursor, edit):
+        return cursor
+    _play_loop.loop = loop
+    _play_loop.times = times
+    _play_loop.expands = True
+    _play_loop.stateful = loop.body.stateful
+    return (_play_loop, 0)
+
+
+def expand_loop(command):
+    """
+    The commands that replace a loop entry on the queue: the body, and then
+    the loop again, one play shorter.
+    """
+    body = command.loop.next_body()
+    if command.times > 1:
+        return body.commands + [loop_entry(command.loop, command.times - 1)]
+    return list(body.commands)
+
+
+def is_stateful(command):
+    fragment = getattr(command, 'fragment', None)
+    if fragment is not None:
+        return fragment.stateful
+    return getattr(command, 'stateful', False)
+
+
+def duration(commands):
+    """
+    How long `commands` take to play, in milliseconds (not counting the
+    commands that are only compiled during playback, like `transform_to`).
+    """
+    total = 0
+    for command, delay in commands:
+        total += delay
+        fragment = getattr(command, 'fragment', None)
+        if fragment is not None:
+            total += fragment.duration
+        loop = getattr(command, 'loop', None)
+        if loop is not None:
+            total += command.times * loop.body.duration
+    return total
+
+
+class FragmentCache(object):
+    """
+    Compiled fragments, by key.  The key must change whenever the source of
+    the fragment does (e.g. it includes the file's modification time).
+    """
+    def __init__(self):
+        self._fragments = {}
+
+    def get(self, key, compile):
+        """
+        The fragment for `key`, calling `compile()` for its commands if it
+        hasn't been compiled yet (or can't be reused).
+        """
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            fragment = Fragment(compile())
+            if not fragment.stateful:
+                self._fragments[key] = fragment
+        return fragment
+
+    def clear(self):
+        self._fragments.clear()
+
+    def __len__(self):
+        return len(self._fragments)
+
+
+def substitute(value, params):
+    """
+    Replaces `{name}` with `params['name']` in every string in `value` (which
+    can be nested lists and dicts, as parsed from YAML).  A string that is only
+    `{name}` is replaced by the parameter itself, so numbers stay numbers.
+    Other braces are left alone, so code can be written as usual.
+    """
+    if isinstance(value, str):
+        if value.startswith('{') and value.endswith('}') and value[1:-1] in params:
+            return params[value[1:-1]]
+        for name, param in params.items():
+            value = value.replace('{' + name + '}', str(param))
+        return value
+    if isinstance(value, list):
+        return [substitute(item, params) for item in value]
+    if isinstance(value, dict):
+        return dict((substitute(key, params), substitute(item, params)) for key, item in value.items())
+    return value
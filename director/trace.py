@@ -0,0 +1,77 @@
+"""
+Records live playback timing as Chrome trace-event JSON, which can be opened in
+`chrome://tracing` or <https://ui.perfetto.dev>.
+
+Each director command shows up as three slices: the whole timer tick on the
+"tick" track, the time spent inside `ScreencastDirectorCmdCommand.run` on the
+"edit" track, and the idle gap before the next timer fired on the "idle" track.
+The time the command was *supposed* to run is recorded as an instant event on
+the "schedule" track, and its lateness is in the tick's `args`.
+"""
+import json
+import time
+
+
+TICK_TID = 1
+EDIT_TID = 2
+IDLE_TID = 3
+SCHEDULE_TID = 4
+
+_THREAD_NAMES = {
+    TICK_TID: 'tick',
+    EDIT_TID: 'edit',
+    IDLE_TID: 'idle',
+    SCHEDULE_TID: 'schedule',
+}
+
+
+def now():
+    return time.perf_counter()
+
+
+class PlaybackTrace(object):
+    def __init__(self, origin=None, pid=1):
+        self.pid = pid
+        self.origin = now() if origin is None else origin
+        self.events = []
+        self._last_end = None
+        for tid, name in _THREAD_NAMES.items():
+            self.events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                'args': {'name': name},
+            })
+
+    def _us(self, t):
+        return (t - self.origin) * 1000000.0
+
+    def _slice(self, tid, name, start, stop, args=None):
+        event = {
+            'name': name, 'cat': 'screencast_director', 'ph': 'X',
+            'pid': self.pid, 'tid': tid,
+            'ts': self._us(start), 'dur': max(0.0, self._us(stop) - self._us(start)),
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def command(self, name, scheduled, started, edit_start, edit_stop, finished, delay):
+        """
+        Records one timer tick.  All times are `time.perf_counter()` values;
+        `scheduled` may be `None` for the first command of a take.
+        """
+        if self._last_end is not None:
+            self._slice(IDLE_TID, 'gap', self._last_end, started)
+        args = {'delay_ms': delay}
+        if scheduled is not None:
+            args['late_ms'] = (started - scheduled) * 1000.0
+            self.events.append({
+                'name': name, 'cat': 'screencast_director', 'ph': 'i', 's': 't',
+                'pid': self.pid, 'tid': SCHEDULE_TID, 'ts': self._us(scheduled),
+            })
+        self._slice(TICK_TID, name, started, finished, args)
+        self._slice(EDIT_TID, name, edit_start, edit_stop)
+        self._last_end = finished
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
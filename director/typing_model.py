@@ -0,0 +1,175 @@
+"""
+Typing models turn the text of a `write` into per-letter delays that look like
+a person typing it.  The "qwerty" model looks up every bigram (the previous
+letter and the next one) in a precomputed table, built from where the two keys
+are on a QWERTY keyboard:
+
+* the same key twice is fastest,
+* keys typed with alternate hands are fast (one hand moves while the other
+  types),
+* keys typed with the same finger are slow, more so the farther apart they are,
+* shifted characters are a little slower.
+
+Every bigram gets a delay distribution, the centre and spread of a range, as a
+fraction of `delay_max - delay_min`.  The table for the 95 printable ASCII
+characters, newline, and "anything else" is two `bytearray`s of 97 * 97
+entries.  Text is mapped to table slots with one `str.translate`, and sampling
+a delay is a table lookup and some integer arithmetic, so it costs about as much
+as `random.randrange`.
+"""
+# characters covered by the table: "\n" takes the slot of DEL (127), and every
+# other character shares the last slot
+FIRST = 32
+NEWLINE_SLOT = 95
+OTHER_SLOT = 96
+SIZE = 97
+SLOTS = dict((code, chr(code - FIRST)) for code in range(FIRST, FIRST + NEWLINE_SLOT))
+SLOTS[ord('\n')] = chr(NEWLINE_SLOT)
+
+ROWS = [
+    ('`1234567890-=', '~!@#$%^&*()_+'),
+    ('qwertyuiop[]\\', 'QWERTYUIOP{}|'),
+    ("asdfghjkl;'", 'ASDFGHJKL:"'),
+    ('zxcvbnm,./', 'ZXCVBNM<>?'),
+]
+# horizontal offset of each row, in keys
+ROW_OFFSETS = [0, 0.5, 0.75, 1.25]
+# finger for each column of the letter rows, from the left pinky (0) to the
+# right pinky (7); the number row is one column to the right of these
+FINGERS = [0, 1, 2, 3, 3, 4, 4, 5, 6, 7, 7, 7, 7]
+
+
+class _Slots(dict):
+    """
+    A `str.translate` table from characters to table slots.
+    """
+    def __missing__(self, code):
+        return chr(OTHER_SLOT)
+
+
+SLOTS = _Slots(SLOTS)
+
+
+def _slot(letter):
+    return ord(letter.translate(SLOTS))
+
+
+def _key_positions():
+    """
+    `{letter: (row, x, finger, shifted)}` for every key on the keyboard.
+    Space is typed with a thumb, which counts as "the other hand" for every
+    other key; newline is the right pinky.
+    """
+    keys = {}
+    for row, (plain, shifted) in enumerate(ROWS):
+        for col, (letter, shift_letter) in enumerate(zip(plain, shifted)):
+            column = max(0, col - 1) if row == 0 else col
+            finger = FINGERS[min(column, len(FINGERS) - 1)]
+            x = col + ROW_OFFSETS[row]
+            keys[letter] = (row, x, finger, False)
+            keys[shift_letter] = (row, x, finger, True)
+    keys[' '] = (4, 5.5, None, False)
+    keys['\n'] = (2, 12.75, 7, False)
+    return keys
+
+
+def _bigram(first, second):
+    """
+    The (centre, spread) of the delay before typing `second` after `first`,
+    both fractions of the delay range.
+    """
+    row1, x1, finger1, _ = first
+    row2, x2, finger2, shifted = second
+    distance = ((row1 - row2) ** 2 + (x1 - x2) ** 2) ** 0.5
+    if first == second:
+        centre, spread = 0.1, 0.15
+    elif finger1 is None or finger2 is None or (finger1 < 4) != (finger2 < 4):
+        # alternate hands, or the space bar
+        centre, spread = 0.3, 0.4
+    elif finger1 == finger2:
+        centre, spread = 0.7 + 0.1 * distance, 0.4
+    else:
+        centre, spread = 0.45 + 0.05 * distance, 0.5
+    if shifted:
+        centre += 0.2
+    centre = min(centre, 0.95)
+    # keep the whole distribution inside the delay range
+    return centre, min(spread, 2 * centre, 2 * (1 - centre))
+
+
+class TypingModel(object):
+    """
+    A bigram delay table.  `centres` and `spreads` are `bytearray`s of
+    `SIZE * SIZE` entries, indexed by `previous_slot * SIZE + slot`, holding
+    fractions of the delay range in 1/255ths.  A spread must not reach past
+    either end of the range (`spread <= 2 * min(centre, 255 - centre)`).
+    """
+    def __init__(self, centres, spreads):
+        self.centres = centres
+        self.spreads = spreads
+        # `offset = base + spread * noise` is the delay in 1/(255 * 256)ths of
+        # the range, for noise in range(256)
+        self._bases = [centre * 256 - spread * 128 for centre, spread in zip(centres, spreads)]
+        self._spreads = list(spreads)
+
+    @classmethod
+    def qwerty(cls):
+        keys = _key_positions()
+        centres = bytearray([128]) * (SIZE * SIZE)
+        spreads = bytearray([254]) * (SIZE * SIZE)
+        for first_letter, first in keys.items():
+            first_slot = _slot(first_letter)
+            for second_letter, second in keys.items():
+                index = first_slot * SIZE + _slot(second_letter)
+                centre, spread = _bigram(first, second)
+                centre = int(round(centre * 255))
+                centres[index] = centre
+                spreads[index] = min(int(round(spread * 255)), 2 * min(centre, 255 - centre))
+        return cls(centres, spreads)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a table written by `dump`.
+        """
+        with open(path, 'rb') as f:
+            data = bytearray(f.read())
+        if len(data) != 2 * SIZE * SIZE:
+            raise ValueError('{path} is not a typing model table'.format(path=path))
+        return cls(data[:SIZE * SIZE], data[SIZE * SIZE:])
+
+    def dump(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.centres + self.spreads)
+
+    def delays(self, text, noise, delay_min, delay_max):
+        """
+        A delay for every letter of `text`.  `noise` is a sequence of random
+        ints in `range(256)`, one per letter, that picks a delay within each
+        bigram's distribution.
+        """
+        bases = self._bases
+        spreads = self._spreads
+        span = max(0, delay_max - delay_min)
+        scale = 255 * 256
+        slots = [ord(slot) for slot in text.translate(SLOTS)]
+        # the first letter is typed as if it followed a newline
+        indexes = [previous * SIZE + slot for previous, slot in zip([NEWLINE_SLOT] + slots, slots)]
+        return [delay_min + span * (bases[index] + spreads[index] * random_value) // scale
+            for index, random_value in zip(indexes, noise)]
+
+
+_models = {}
+
+
+def get_model(name):
+    """
+    Returns the typing model called `name`: "qwerty", or the path of a table
+    written by `TypingModel.dump`.  Models are built or loaded once and cached.
+    """
+    if name not in _models:
+        if name == 'qwerty':
+            _models[name] = TypingModel.qwerty()
+        else:
+            _models[name] = TypingModel.load(name)
+    return _models[name]
@@ -6,16 +6,48 @@ from .events import *
 from .nodes import *
 
 from .loader import *
-from .dumper import *
 
 __version__ = '3.10'
-try:
-    from .cyaml import *
-    __with_libyaml__ = True
-except ImportError:
-    __with_libyaml__ = False
 
 import io
+import sys
+
+# The dumper (and emitter, serializer, representer) and the libyaml bindings
+# are only imported when they are first used, so that loading YAML doesn't pay
+# for them.  On Python 3.7+ `yaml.Dumper`, `yaml.CLoader` etc. still work, via
+# the module `__getattr__` below.  Older Pythons (Sublime Text 3 has 3.3) don't
+# call a module `__getattr__` (PEP 562), so they import them up front, as
+# before.
+
+_DUMPER_NAMES = ('BaseDumper', 'SafeDumper', 'Dumper')
+_CYAML_NAMES = ('CParser', 'CEmitter', 'CBaseLoader', 'CSafeLoader', 'CLoader',
+        'CBaseDumper', 'CSafeDumper', 'CDumper')
+
+def _dumper(name='Dumper'):
+    from . import dumper
+    return getattr(dumper, name)
+
+def __getattr__(name):
+    if name in _DUMPER_NAMES:
+        return _dumper(name)
+    if name in _CYAML_NAMES:
+        from . import cyaml
+        return getattr(cyaml, name)
+    if name == '__with_libyaml__':
+        try:
+            from . import cyaml
+        except ImportError:
+            return False
+        return True
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+if sys.version_info < (3, 7):
+    from .dumper import *
+    try:
+        from .cyaml import *
+        __with_libyaml__ = True
+    except ImportError:
+        __with_libyaml__ = False
 
 def scan(stream, Loader=Loader):
     """
@@ -101,13 +133,15 @@ def safe_load_all(stream):
     """
     return load_all(stream, SafeLoader)
 
-def emit(events, stream=None, Dumper=Dumper,
+def emit(events, stream=None, Dumper=None,
         canonical=None, indent=None, width=None,
         allow_unicode=None, line_break=None):
     """
     Emit YAML parsing events into a stream.
     If stream is None, return the produced string instead.
     """
+    if Dumper is None:
+        Dumper = _dumper()
     getvalue = None
     if stream is None:
         stream = io.StringIO()
@@ -122,7 +156,7 @@ def emit(events, stream=None, Dumper=Dumper,
     if getvalue:
         return getvalue()
 
-def serialize_all(nodes, stream=None, Dumper=Dumper,
+def serialize_all(nodes, stream=None, Dumper=None,
         canonical=None, indent=None, width=None,
         allow_unicode=None, line_break=None,
         encoding=None, explicit_start=None, explicit_end=None,
@@ -131,6 +165,8 @@ def serialize_all(nodes, stream=None, Dumper=Dumper,
     Serialize a sequence of representation trees into a YAML stream.
     If stream is None, return the produced string instead.
     """
+    if Dumper is None:
+        Dumper = _dumper()
     getvalue = None
     if stream is None:
         if encoding is None:
@@ -152,14 +188,14 @@ def serialize_all(nodes, stream=None, Dumper=Dumper,
     if getvalue:
         return getvalue()
 
-def serialize(node, stream=None, Dumper=Dumper, **kwds):
+def serialize(node, stream=None, Dumper=None, **kwds):
     """
     Serialize a representation tree into a YAML stream.
     If stream is None, return the produced string instead.
     """
     return serialize_all([node], stream, Dumper=Dumper, **kwds)
 
-def dump_all(documents, stream=None, Dumper=Dumper,
+def dump_all(documents, stream=None, Dumper=None,
         default_style=None, default_flow_style=None,
         canonical=None, indent=None, width=None,
         allow_unicode=None, line_break=None,
@@ -169,6 +205,8 @@ def dump_all(documents, stream=None, Dumper=Dumper,
     Serialize a sequence of Python objects into a YAML stream.
     If stream is None, return the produced string instead.
     """
+    if Dumper is None:
+        Dumper = _dumper()
     getvalue = None
     if stream is None:
         if encoding is None:
@@ -192,7 +230,7 @@ def dump_all(documents, stream=None, Dumper=Dumper,
     if getvalue:
         return getvalue()
 
-def dump(data, stream=None, Dumper=Dumper, **kwds):
+def dump(data, stream=None, Dumper=None, **kwds):
     """
     Serialize a Python object into a YAML stream.
     If stream is None, return the produced string instead.
@@ -205,7 +243,7 @@ def safe_dump_all(documents, stream=None, **kwds):
     Produce only basic YAML tags.
     If stream is None, return the produced string instead.
     """
-    return dump_all(documents, stream, Dumper=SafeDumper, **kwds)
+    return dump_all(documents, stream, Dumper=_dumper('SafeDumper'), **kwds)
 
 def safe_dump(data, stream=None, **kwds):
     """
@@ -213,26 +251,30 @@ def safe_dump(data, stream=None, **kwds):
     Produce only basic YAML tags.
     If stream is None, return the produced string instead.
     """
-    return dump_all([data], stream, Dumper=SafeDumper, **kwds)
+    return dump_all([data], stream, Dumper=_dumper('SafeDumper'), **kwds)
 
 def add_implicit_resolver(tag, regexp, first=None,
-        Loader=Loader, Dumper=Dumper):
+        Loader=Loader, Dumper=None):
     """
     Add an implicit scalar detector.
     If an implicit scalar value matches the given regexp,
     the corresponding tag is assigned to the scalar.
     first is a sequence of possible initial characters or None.
     """
+    if Dumper is None:
+        Dumper = _dumper()
     Loader.add_implicit_resolver(tag, regexp, first)
     Dumper.add_implicit_resolver(tag, regexp, first)
 
-def add_path_resolver(tag, path, kind=None, Loader=Loader, Dumper=Dumper):
+def add_path_resolver(tag, path, kind=None, Loader=Loader, Dumper=None):
     """
     Add a path based resolver for the given tag.
     A path is a list of keys that forms a path
     to a node in the representation tree.
     Keys can be string values, integers, or None.
     """
+    if Dumper is None:
+        Dumper = _dumper()
     Loader.add_path_resolver(tag, path, kind)
     Dumper.add_path_resolver(tag, path, kind)
 
@@ -253,22 +295,26 @@ def add_multi_constructor(tag_prefix, multi_constructor, Loader=Loader):
     """
     Loader.add_multi_constructor(tag_prefix, multi_constructor)
 
-def add_representer(data_type, representer, Dumper=Dumper):
+def add_representer(data_type, representer, Dumper=None):
     """
     Add a representer for the given type.
     Representer is a function accepting a Dumper instance
     and an instance of the given data type
     and producing the corresponding representation node.
     """
+    if Dumper is None:
+        Dumper = _dumper()
     Dumper.add_representer(data_type, representer)
 
-def add_multi_representer(data_type, multi_representer, Dumper=Dumper):
+def add_multi_representer(data_type, multi_representer, Dumper=None):
     """
     Add a representer for the given type.
     Multi-representer is a function accepting a Dumper instance
     and an instance of the given data type or subtype
     and producing the corresponding representation node.
     """
+    if Dumper is None:
+        Dumper = _dumper()
     Dumper.add_multi_representer(data_type, multi_representer)
 
 class YAMLObjectMetaclass(type):
@@ -279,7 +325,7 @@ class YAMLObjectMetaclass(type):
         super(YAMLObjectMetaclass, cls).__init__(name, bases, kwds)
         if 'yaml_tag' in kwds and kwds['yaml_tag'] is not None:
             cls.yaml_loader.add_constructor(cls.yaml_tag, cls.from_yaml)
-            cls.yaml_dumper.add_representer(cls, cls.to_yaml)
+            (cls.yaml_dumper or _dumper()).add_representer(cls, cls.to_yaml)
 
 class YAMLObject(metaclass=YAMLObjectMetaclass):
     """
@@ -290,7 +336,7 @@ class YAMLObject(metaclass=YAMLObjectMetaclass):
     __slots__ = ()  # no direct instantiation, so allow immutable subclasses
 
     yaml_loader = Loader
-    yaml_dumper = Dumper
+    yaml_dumper = None  # Dumper, imported when it's first needed
 
     yaml_tag = None
     yaml_flow_style = None
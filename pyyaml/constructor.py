@@ -7,6 +7,11 @@ from .nodes import *
 
 import collections, datetime, base64, binascii, re, sys, types
 
+try:
+    from collections.abc import Hashable
+except ImportError:
+    from collections import Hashable
+
 class ConstructorError(MarkedYAMLError):
     pass
 
@@ -123,7 +128,7 @@ class BaseConstructor:
         mapping = {}
         for key_node, value_node in node.value:
             key = self.construct_object(key_node, deep=deep)
-            if not isinstance(key, collections.Hashable):
+            if not isinstance(key, Hashable):
                 raise ConstructorError("while constructing a mapping", node.start_mark,
                         "found unhashable key", key_node.start_mark)
             value = self.construct_object(value_node, deep=deep)
@@ -1,10 +1,99 @@
-import random
+import bisect
+import math
+import os
+import time
 import sublime
 import sublime_plugin
-from . import pyyaml
+from .director.api_proxy import ApiCallCounter, ViewProxy
+from .director.control import ControlServer
+from .director.delays import DelayGenerator
+from .director.diff import diff
+from .director.lines import LineIndex
+from .director.marks import MarkTable
+from .director.pump import TimerPump
+from .director.recorder import Recorder, compact
+from .director.search import OccurrenceIndex
+from .director.stats import StatsTable
+from .director.timeline import FragmentCache, Loop, duration, expand_loop, fragment_entry, loop_entry, substitute
+from .director.trace import PlaybackTrace
+from .director.typing_model import get_model
 from functools import reduce
 
 
+def get_setting(key, default=None):
+    return sublime.load_settings('ScreencastDirector.sublime-settings').get(key, default)
+
+
+def data_path(filename):
+    """
+    Returns a path to `filename` in "Packages/User/ScreencastDirector", creating
+    the folder if necessary.  Traces and other reports are written there.
+    """
+    folder = os.path.join(sublime.packages_path(), 'User', 'ScreencastDirector')
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    return os.path.join(folder, filename)
+
+
+def split_blocks(source):
+    """
+    Splits a director file into blocks, which are separated by a blank line
+    followed by a "-".  Returns the `(start, end)` offsets of every block.
+    """
+    search = "\n\n-"
+    parts = source.split(search)
+
+    blocks = []
+
+    skip = parts.pop(0)
+    if len(skip) and skip[0] == "-":
+        blocks.append((0, len(skip.rstrip())))
+
+    offset = len(skip)
+
+    for part in parts:
+        offset += len(search) - 1
+        start = offset
+        offset += 1
+        end = offset + len(part.rstrip())
+        offset += len(part)
+        blocks.append((start, end))
+    return blocks
+
+
+def _moved_block(index, hunks):
+    """
+    Where block `index` is after an edit, given the `hunks` of a diff of the
+    old and new block lists, or `None` if the block itself was changed.
+    """
+    shift = 0
+    for a_start, a_end, b_start, b_end in hunks:
+        if index < a_start:
+            break
+        if index < a_end:
+            return None
+        shift = b_end - a_end
+    return index + shift
+
+
+def load_yaml(content):
+    """
+    Parses a block of director commands.  pyyaml is imported the first time a
+    block is run, rather than when the plugin is loaded, and only the modules
+    that loading needs (not the dumper, nor the libyaml bindings).
+    """
+    from .pyyaml import load
+    return load(content)
+
+
+def dump_yaml(entries):
+    """
+    Writes director commands as a block, i.e. a YAML list.
+    """
+    from .pyyaml import dump
+    return dump(entries, default_flow_style=False, allow_unicode=True, width=1000)
+
+
 def parse(str, check_nl=True):
     if check_nl and "\n" in str:
         return "\n".join(map(lambda line: parse(line, False), str.split("\n")))
@@ -13,20 +102,240 @@ def parse(str, check_nl=True):
     return str
 
 
-class ScreencastDirector(object):
-    the_director = None
+def _chunk_end(text, start, size):
+    """
+    Where a chunk of about `size` characters, starting at `start`, should end:
+    one letter when `size` is 1, otherwise after the next whitespace (for
+    word-sized chunks) or the next newline (for chunks of a line or more).
+    """
+    stop = start + max(1, size)
+    if size <= 1 or stop >= len(text):
+        return min(stop, len(text))
+    if size >= 40:
+        newline = text.find('\n', stop - 1, stop + size)
+        if newline != -1:
+            return newline + 1
+    for index in range(stop - 1, min(len(text), stop + size)):
+        if text[index].isspace():
+            return index + 1
+    return stop
+
+
+def _line_starts(lines):
+    """
+    The offset of every line in `lines` (which were split on newlines), plus
+    the offset one past the final newline.
+    """
+    starts = [0]
+    for line in lines:
+        starts.append(starts[-1] + len(line) + 1)
+    return starts
+
+
+class TargetState(object):
+    """
+    What the director keeps for one target view.  The director plays onto one
+    target at a time: its own attributes with these names belong to the current
+    target (see `ScreencastDirector._switch_target`), and the `TargetState` of
+    every other target holds theirs.
+    """
+    FIELDS = (
+        '_target_view', '_target_view_proxy', 'cursor', 'cursors',
+        '_synced_cursor', '_synced_cursors', '_target_sel', '_frame_open', '_change_count',
+        '_changes', '_external_changes', '_search', '_lines', 'marks',
+        )
+
+    def __init__(self, view=None):
+        self._target_view = view
+        self._target_view_proxy = None
+        self.cursor = None
+        self.cursors = []
+        self._synced_cursor = None
+        self._synced_cursors = []
+        self._target_sel = None
+        self._frame_open = False
+        self._change_count = None
+        self._changes = 0
+        self._external_changes = 0
+        self._search = OccurrenceIndex()
+        self._lines = LineIndex()
+        self.marks = MarkTable()
 
-    def __init__(self):
+
+class ScreencastDirector(object):
+    """
+    A director session: a source view, a target view and everything needed to
+    play one onto the other.  There is one session per window, see
+    `for_window`.
+    """
+    sessions = {}  # {window id: ScreencastDirector}
+    recorders = {}  # {view id: Recorder}, see ScreencastDirectorRecordCommand
+    # seconds that playback may fall behind before its clock is reset, see `_start_timer`
+    MAX_LAG = 0.25
+    # milliseconds after an edit of the source view before it is reloaded
+    RELOAD_DELAY = 300
+
+    @classmethod
+    def for_window(cls, window=None):
+        """
+        The session of `window` (default: the active window), created on first
+        use.  Sessions of windows that have been closed are dropped.
+        """
+        if window is None:
+            window = sublime.active_window()
+        session = cls.sessions.get(window.id())
+        if session is None:
+            open_windows = set(w.id() for w in sublime.windows())
+            for window_id in list(cls.sessions):
+                if window_id not in open_windows:
+                    pump.remove(cls.sessions.pop(window_id))
+            session = cls.sessions[window.id()] = cls(window.id())
+        return session
+
+    def __init__(self, window_id=None):
+        self.window_id = window_id
+        self.api_calls = None
         self.source_view = None
         self.target_view = None
         self.index = 0
         self.commands = []  # stores a list of commands to perform on the target_view.
-        self._mark_offsets = {}
+        self.cursor = None  # the director's cursor in target_view, see `_set_cursor`
+        self.cursors = []  # extra cursors, see `add_cursor`
+        self._synced_cursor = None
+        self._synced_cursors = []
+        self._target_sel = None
+        self._frame_open = False  # the cursors are out of the view's selection, see `_run_on_target`
+        self._change_count = None
+        self._changes = 0
+        self._external_changes = 0  # incremented whenever the user edits the target
+        self._search = OccurrenceIndex()  # see `_occurrences`
+        self._lines = LineIndex()  # see `_line_index`
+        self.marks = MarkTable()
+        # every target view; the director's own attributes hold the current
+        # one's state, see `TargetState`
+        self.targets = [TargetState()]
+        self._target = self.targets[0]
+        self._primary = True
+        self._undo_granularity = 'command'
+        self.delays = DelayGenerator()
+        self._undo_group_open = False
+        self._trace = None
+        self._trace_playback = False  # the `trace_playback` setting, read once per take
+        self._profile = None  # see `_start_profile`
+        self._scheduled = None
+        self._paused = False
+        self._paused_at = None  # see `_playback_time`
+        self._clock_offset = 0.0
+        self._blocks = {}  # {index: (content, entries)}, see `_block_entries`
+        self._block_texts = []  # the text of every block, see `_reload_source`
+        self._reload_due = None  # see `_source_modified`
+        self.fragments = FragmentCache()  # compiled includes and macro calls
+        self.macros = {}  # {name: (params, commands, version)}, see `macro`
+        self._macro_version = 0
+        self._including = set()  # fragments being compiled, to catch recursion
+        self.stats = StatsTable()
+
+    # When the `api_call_budget` setting is on, `source_view` and `target_view`
+    # return a `ViewProxy` that counts every Sublime API call.
+    @property
+    def source_view(self):
+        return self._proxied('_source_view')
+
+    @source_view.setter
+    def source_view(self, view):
+        self._source_view = view
+        self._source_view_proxy = None
+
+    @property
+    def target_view(self):
+        return self._proxied('_target_view')
+
+    @target_view.setter
+    def target_view(self, view):
+        self._target_view = view
+        self._target_view_proxy = None
+
+    def bind_target(self, view, add=False):
+        """
+        Plays onto `view`, instead of the current target view(s), or as well as
+        them if `add` is set.  Every command is compiled once and applied to
+        each target in turn, in the same tick.
+        """
+        self._switch_target(self.targets[0])
+        if not add:
+            del self.targets[1:]
+            self.target_view = view
+        elif self._target_view is None:
+            self.target_view = view
+        elif all(self._view_of(target).id() != view.id() for target in self.targets):
+            self.targets.append(TargetState(view))
+
+    def _view_of(self, target):
+        if target is self._target:
+            return self._target_view
+        return target._target_view
+
+    def _target_local(self, states):
+        """
+        The dict in `states` that belongs to the current target.  Commands
+        that keep state between steps keep one per target in `states`.
+        """
+        state = states.get(self._target)
+        if state is None:
+            state = states[self._target] = {}
+        return state
+
+    def _switch_target(self, target):
+        """
+        Makes `target` the current target: saves the state of the current one
+        in its `TargetState`, and loads the state of `target`.
+        """
+        current = self._target
+        if target is current:
+            return
+        for field in TargetState.FIELDS:
+            setattr(current, field, getattr(self, field))
+            setattr(self, field, getattr(target, field))
+        self._target = target
+
+    def _proxied(self, attr):
+        view = getattr(self, attr)
+        if view is None or self.api_calls is None:
+            return view
+        proxy = getattr(self, attr + '_proxy')
+        if proxy is None or proxy._counter is not self.api_calls:
+            proxy = ViewProxy(view, self.api_calls)
+            setattr(self, attr + '_proxy', proxy)
+        return proxy
+
+    def _update_api_calls(self):
+        """
+        Checks the `api_call_budget` setting at the start of every take.
+        `false` turns counting off, `true` counts without a budget, and a
+        number also reports frames that go over that many calls.
+        """
+        budget = get_setting('api_call_budget', False)
+        if budget is False or budget is None:
+            self.api_calls = None
+        elif self.api_calls is None:
+            self.api_calls = ApiCallCounter(None if budget is True else budget)
+        else:
+            self.api_calls.budget = None if budget is True else budget
 
     def _refresh_source(self):
         if self.source_view is None:
             return
 
+        if self.api_calls is not None:
+            self.api_calls.begin('refresh_source')
+            try:
+                self._do_refresh_source()
+            finally:
+                self.api_calls.end()
+        else:
+            self._do_refresh_source()
+
+    def _do_refresh_source(self):
         active_view = sublime.active_window().active_view()
         regions = self.source_view.get_regions('screencast_director')
         if self.index < 0:
@@ -35,9 +344,9 @@ class ScreencastDirector(object):
             self.index = 0
 
         self.source_view.sel().clear()
-        self.source_view.sel().add(regions[ScreencastDirector.the_director.index])
+        self.source_view.sel().add(regions[self.index])
         pos = self.source_view.viewport_position()
-        self.source_view.show_at_center(regions[ScreencastDirector.the_director.index])
+        self.source_view.show_at_center(regions[self.index])
         new_pos = self.source_view.viewport_position()
         if abs(new_pos[0] - pos[0]) <= 1.0 and abs(new_pos[1] - pos[1]) <= 1.0:
             self.source_view.set_viewport_position((new_pos[0], new_pos[1] + 1))
@@ -52,19 +361,321 @@ class ScreencastDirector(object):
         window.focus_view(self.source_view)
         window.focus_view(active_view)
 
+    def _bind_blocks(self, source):
+        """
+        Splits `source` (the text of the source view) into blocks, and outlines
+        them in the source view.  Returns the number of blocks.
+        """
+        offsets = split_blocks(source)
+        self._block_texts = [source[start:end] for start, end in offsets]
+        if offsets:
+            self._source_view.add_regions(
+                'screencast_director',
+                [sublime.Region(start, end) for start, end in offsets],
+                'source',
+                '',
+                sublime.DRAW_OUTLINED
+                )
+        else:
+            self._source_view.erase_regions('screencast_director')
+        return len(offsets)
+
+    def _source_modified(self):
+        """
+        Called whenever the source view changes.  The blocks are split again
+        once the edits pause for `RELOAD_DELAY`, see `_reload_source`: every
+        edit pushes the reload back.
+        """
+        pending = self._reload_due is not None
+        self._reload_due = time.perf_counter() + self.RELOAD_DELAY / 1000.0
+        if not pending:
+            sublime.set_timeout(self._reload_source, self.RELOAD_DELAY)
+
+    def _reload_source(self):
+        """
+        Splits the edited source into blocks again, without losing our place:
+        the new blocks are diffed against the old ones, and the index and the
+        parsed blocks that didn't change move to where their blocks are now.
+        Changed blocks are parsed again when they are run.
+        """
+        delay = self._reload_due - time.perf_counter()
+        if delay > 0:
+            # edited again since this was scheduled
+            sublime.set_timeout(self._reload_source, int(math.ceil(delay * 1000)))
+            return
+        self._reload_due = None
+        view = self._source_view
+        if view is None or view.window() is None:
+            return
+        old_texts = self._block_texts
+        count = self._bind_blocks(view.substr(sublime.Region(0, view.size())))
+        if self._block_texts == old_texts:
+            return
+        hunks = diff(old_texts, self._block_texts)
+        blocks = {}
+        for index, cached in self._blocks.items():
+            moved = _moved_block(index, hunks)
+            if moved is not None:
+                blocks[moved] = cached
+        self._blocks = blocks
+        moved = 0
+        if self.index < len(old_texts):
+            moved = _moved_block(self.index, hunks)
+            if moved is None:
+                # the current block was edited: stay on (what is now) that block
+                for a_start, a_end, b_start, b_end in hunks:
+                    if a_start <= self.index < a_end:
+                        moved = min(b_start + self.index - a_start, max(b_start, b_end - 1))
+                        break
+        # a deleted block leaves the index on the block after it, or the last one
+        self.index = max(0, min(moved, count - 1))
+        if moved != self.index and count:
+            self._refresh_source()
+        sublime.status_message('ScreencastDirector reloaded {count} blocks, index is at {index}'.format(count=count, index=self.index))
+
+    def _block_entries(self, regions):
+        """
+        The parsed YAML of the current block.  Blocks are only parsed again
+        when their text changes.
+        """
+        content = self.source_view.substr(regions[self.index])
+        cached = self._blocks.get(self.index)
+        if cached is not None and cached[0] == content:
+            return cached[1]
+        entries = load_yaml(content)
+        self._blocks[self.index] = (content, entries)
+        return entries
+
     def _run(self):
-        regions = self.source_view.get_regions('screencast_director')
-        region = regions[self.index]
-        content = self.source_view.substr(region)
-        commands = pyyaml.load(content)
-        for entry in commands:
-            self._execute(entry)
-        if len(self.target_view.sel()):
-            region = self.target_view.sel()[0]
+        if self._profile is None and get_setting('profile_playback', False):
+            self._start_profile()
+        if self._profile is not None:
+            self._profile.enable()
+        try:
+            self._update_api_calls()
+            self._switch_target(self.targets[0])
+            self._search = OccurrenceIndex()
+            regions = self.source_view.get_regions('screencast_director')
+            commands = self._block_entries(regions)
+            self._undo_granularity = get_setting('undo_granularity', 'command')
+            self._seed_delays(self.index)
+            queued = len(self.commands)
+            try:
+                for entry in commands:
+                    self._execute_undoable(entry)
+            except Exception:
+                # don't leave half a block on the queue
+                del self.commands[queued:]
+                raise
+            if self.api_calls is not None:
+                self.api_calls.begin('set_target_cursors')
+            self._set_target_cursors()
+            if self.api_calls is not None:
+                self.api_calls.end()
+            self._start_timer()
+        finally:
+            if self._profile is not None:
+                self._profile.disable()
+
+    def _set_target_cursors(self):
+        """
+        Starts every target at its own selection, see `_set_cursor`.  Search
+        patterns are registered with the first target when the block is
+        compiled, and copied to the others.
+        """
+        patterns = self._search.matcher.patterns
+        for target in self.targets:
+            self._switch_target(target)
+            if target is not self.targets[0]:
+                self._search = OccurrenceIndex(patterns)
+            if len(self.target_view.sel()):
+                region = self.target_view.sel()[0]
+            else:
+                region = sublime.Region(0, 0)
+            self._set_cursor(region)
+        self._switch_target(self.targets[0])
+
+    def _seed_delays(self, index):
+        """
+        Seeds the delay generator from the `random_seed` setting and the block
+        `index`, so that every block plays back with the same timing in every
+        take (and different blocks don't share theirs).
+        """
+        seed = get_setting('random_seed', None)
+        if seed is None:
+            self.delays.seed(None)
         else:
-            region = sublime.Region(0, 0)
-        self.target_view.add_regions('screencast_director', [region], 'source', '', sublime.HIDDEN)
-        self._start_timer()
+            self.delays.seed(seed * 100003 + index)
+
+    def _set_cursor(self, cursor):
+        """
+        The director owns its cursor: `self.cursor` is the authoritative
+        position, and it is pushed to the target view (the selection and the
+        hidden 'screencast_director' region) at the end of every frame, see
+        `_end_frame`.
+
+        When the view's change count shows that someone else (i.e. the user)
+        edited the buffer since the last take, the marks are read back and the
+        line and search indexes are dropped, since those edits may have shifted
+        them.
+        """
+        self.cursor = cursor
+        self.cursors = []
+        self._synced_cursor = None
+        self._synced_cursors = []
+        self._target_sel = self.target_view.sel()
+        self._frame_open = False
+        change_count = self.target_view.change_count()
+        if change_count != self._change_count:
+            self._external_edit()
+            self._pull_marks()
+        self._push_cursor()
+        self._change_count = change_count
+
+    def _pull_cursor(self):
+        change_count = self.target_view.change_count()
+        if change_count != self._change_count:
+            regions = self.target_view.get_regions('screencast_director')
+            if regions:
+                self.cursor = self._synced_cursor = regions[0]
+            if self._synced_cursors:
+                regions = self.target_view.get_regions('screencast_director_cursors')
+                self.cursors = regions
+                self._synced_cursors = list(regions)
+            self._change_count = change_count
+            self._external_edit()
+            self._pull_marks()
+        return self.cursor
+
+    def _pull_marks(self):
+        if len(self.marks):
+            regions = self.target_view.get_regions('screencast_director_marks')
+            self.marks.load([region.begin() for region in regions])
+
+    def _push_cursor(self):
+        if self.cursor != self._synced_cursor:
+            self.target_view.add_regions('screencast_director', [self.cursor], 'source', '', sublime.HIDDEN)
+            self._synced_cursor = self.cursor
+        if self.cursors != self._synced_cursors:
+            if self.cursors:
+                self.target_view.add_regions('screencast_director_cursors', self.cursors, 'source', '', sublime.HIDDEN)
+            else:
+                self.target_view.erase_regions('screencast_director_cursors')
+            self._synced_cursors = list(self.cursors)
+        if self.marks.dirty:
+            if len(self.marks):
+                regions = [sublime.Region(point, point) for point in self.marks.positions()]
+                self.target_view.add_regions('screencast_director_marks', regions, 'source', '', sublime.HIDDEN)
+            else:
+                self.target_view.erase_regions('screencast_director_marks')
+            self.marks.dirty = False
+
+    def _replace(self, edit, region, text):
+        """
+        All edits to the target view go through `_replace` and `_insert`, so
+        that the director can tell its own changes apart from the user's, and
+        keep its indexes up to date.
+        """
+        self.target_view.replace(edit, region, text)
+        if self._changes is not None:
+            self._changes += 1
+        self._search.edit(region.begin(), region.end(), len(text))
+        self._lines.edit(region.begin(), region.end(), text)
+        self.marks.edit(region.begin(), region.end(), len(text))
+
+    def _insert(self, edit, point, text):
+        self.target_view.insert(edit, point, text)
+        if self._changes is not None:
+            self._changes += 1
+        self._search.edit(point, point, len(text))
+        self._lines.edit(point, point, text)
+        self.marks.edit(point, point, len(text))
+
+    def _external_edit(self):
+        """
+        Someone else changed the target view; nothing the director remembers
+        about its contents can be trusted.
+        """
+        self._external_changes += 1
+        self._search.invalidate()
+        self._lines.invalidate()
+
+    def _occurrences(self, pattern):
+        """
+        The sorted start positions of `pattern` in the target view, from the
+        occurrence index.  Commands that use this should register their pattern
+        with `self._search.add_pattern` when they are compiled, so that all the
+        patterns of a block are found in the same pass.
+        """
+        view = self.target_view
+        return self._search.occurrences(pattern, lambda begin, end: view.substr(sublime.Region(begin, end)), view.size)
+
+    def _line_index(self):
+        """
+        The line index of the target view, see `director.lines`.  The whole
+        buffer is only read when the index has to be built.
+        """
+        view = self.target_view
+        return self._lines.load(lambda: view.substr(sublime.Region(0, view.size())))
+
+    def _replace_cursors(self, edit, cursor, text, advance=None):
+        """
+        Replaces the primary `cursor` and every extra cursor in `self.cursors`
+        with `text`, all in the current edit, and places each cursor `advance`
+        characters after the start of its replacement (default: after `text`).
+        Returns the new primary cursor.
+        """
+        if advance is None:
+            advance = len(text)
+        if not self.cursors:
+            self._replace(edit, cursor, text)
+            return cursor.begin() + advance
+
+        # sorted, without overlaps; the primary cursor is whichever region
+        # contains it.
+        regions = []
+        primary = 0
+        for region in sorted([cursor] + self.cursors, key=lambda region: (region.begin(), region.end())):
+            if regions and region.begin() < regions[-1].end() or regions and region == regions[-1]:
+                if region == cursor:
+                    primary = len(regions) - 1
+                continue
+            if region == cursor:
+                primary = len(regions)
+            regions.append(region)
+
+        for region in reversed(regions):
+            self._replace(edit, region, text)
+
+        points = []
+        shift = 0
+        for region in regions:
+            points.append(region.begin() + shift + advance)
+            shift += len(text) - region.size()
+        self.cursors = [sublime.Region(point, point) for index, point in enumerate(points) if index != primary]
+        return points[primary]
+
+    def _move_cursors(self, move):
+        """
+        Applies `move` (a function that accepts and returns a `Region`) to every
+        extra cursor.
+        """
+        if not self.cursors:
+            return
+        size = self.target_view.size()
+        cursors = []
+        for region in self.cursors:
+            region = move(region)
+            region = sublime.Region(max(0, min(size, region.a)), max(0, min(size, region.b)))
+            cursors.append(region)
+        self.cursors = cursors
+
+    def _unknown_changes(self):
+        """
+        Commands that modify the buffer in ways the director can't count (e.g.
+        `run_command`) call this, and the change count is re-read afterwards.
+        """
+        self._changes = None
 
     def _execute(self, entry):
         """
@@ -101,46 +712,380 @@ class ScreencastDirector(object):
                 cmd()
             else:
                 raise
-        except AssertionError as e:
-            self.view.show_popup('ScreencastDirector compile error: %s' % e.message)
+        except (AssertionError, EnvironmentError) as e:
+            # nested entries (includes, macros) pass the error up, report it once
+            if not getattr(e, 'reported', False):
+                e.reported = True
+                sublime.error_message('ScreencastDirector compile error: {error}'.format(error=e))
             raise
 
+    def _execute_undoable(self, entry):
+        """
+        Executes a top-level entry so that all of its edits become one undo
+        step, unless the `undo_granularity` setting is "character".
+        """
+        start = len(self.commands)
+        self._execute(entry)
+        added = len(self.commands) - start
+        if self._undo_granularity != 'character' and (added > 1 or added == 1 and getattr(self.commands[-1][0], 'expands', False)):
+            self.commands.insert(start, self._undo_marker('mark_undo_groups_for_gluing'))
+            self.commands.append(self._undo_marker('glue_marked_undo_groups'))
+
+    def _undo_marker(self, undo_command):
+        """
+        A queue entry that runs one of Sublime's undo-gluing commands between
+        edits, instead of making an edit.
+        """
+        def _undo(cursor, edit):
+            return cursor
+        _undo.undo_command = undo_command
+        return (_undo, 0)
+
     def _append_command(self, command, delay=None):
         if delay is None:
-            delay = random.randint(50, 150)
+            delay = self.delays.randint(50, 150)
         self.commands.append((command, delay))
 
+    def _splice(self, compile):
+        """
+        Calls `compile`, which adds commands as usual, and moves the commands it
+        added to the front of the queue so that they run next.  This is for
+        commands that can only be compiled during playback, because they
+        depend on the contents of the target view at that time.
+
+        When there are several target views, the commands are compiled against
+        the first one (`compile` isn't called for the others), and played onto
+        all of them.
+        """
+        if not self._primary:
+            return
+        queue = self._collect(compile)
+        if not self._undo_group_open and self._undo_granularity != 'character' and len(queue) > 1:
+            queue.insert(0, self._undo_marker('mark_undo_groups_for_gluing'))
+            queue.append(self._undo_marker('glue_marked_undo_groups'))
+        self.commands[0:0] = queue
+
+    def _collect(self, compile):
+        """
+        Calls `compile`, which adds commands as usual, and returns the commands
+        it added instead of leaving them on the queue.
+        """
+        queue = self.commands
+        self.commands = []
+        try:
+            compile()
+        finally:
+            self.commands, queue = queue, self.commands
+        return queue
+
+    def _append_fragment(self, fragment):
+        """
+        Adds a compiled `Fragment` to the queue, by reference: its commands are
+        spliced in when playback gets to it, see `_run_next`.
+        """
+        self.commands.append(fragment_entry(fragment))
+
+    def _source_path(self, path):
+        """
+        Resolves `path` relative to the folder of the source view's file.
+        """
+        path = os.path.expanduser(path)
+        if not os.path.isabs(path):
+            file_name = self._source_view and self._source_view.file_name()
+            if file_name:
+                path = os.path.join(os.path.dirname(file_name), path)
+        return path
+
+    def pause(self):
+        """
+        Pauses the take that is playing, or resumes a paused one.  Running
+        another block also resumes it.
+        """
+        if self._paused:
+            self._start_timer()
+        elif self.commands:
+            self._paused = True
+            self._paused_at = time.perf_counter()
+            self._scheduled = None
+            pump.remove(self)
+
+    def seek(self, offset):
+        """
+        Fast-forwards the take that is playing by `offset` milliseconds: the
+        commands that would have played in that time are run at once, and the
+        rest play on from there.
+        """
+        remaining = offset / 1000.0
+        while self.commands and remaining > 0:
+            self._scheduled = time.perf_counter()
+            started = self._scheduled
+            self._run_next(started)
+            remaining -= self._scheduled - started
+        self._end_frame()
+        self._clock_offset -= offset / 1000.0
+        self._scheduled = None
+        if self.commands and not self._paused:
+            self._start_timer()
+
     def _start_timer(self):
+        """
+        Starts (or continues) playing the command queue, see `_tick`.
+        """
+        self._paused = False
+        if self._paused_at is not None:
+            self._clock_offset += time.perf_counter() - self._paused_at
+            self._paused_at = None
+        if self._scheduled is None:
+            pump.frame_budget = get_setting('frame_budget', 16) / 1000.0
+            self._trace_playback = get_setting('trace_playback', False)
+        pump.wake(self, self._scheduled)
+
+    def time_left(self):
+        """
+        How long the rest of the take will play, in seconds (see
+        `director.timeline.duration`).
+        """
+        return duration(self.commands) / 1000.0
+
+    def _abort(self):
+        """
+        Drops the rest of the take after a command failed, see `TimerPump`.
+        The trace and profile of what did play are still written.
+        """
+        self.commands = []
+        self._scheduled = None
+        self._undo_group_open = False
+        self._end_frame()
+        self._finish_take()
+
+    def _finish_take(self):
+        """
+        Writes the trace and the profile of the take that just ended, if they
+        were switched on.
+        """
+        if self._trace is not None:
+            self._write_trace()
+        if self._profile is not None:
+            self._write_profile()
+
+    def _playback_time(self):
+        """
+        A clock, in seconds, for commands that pace themselves: it stands still
+        while the take is paused, and jumps ahead on `seek`.
+        """
+        if self._paused_at is not None:
+            return self._paused_at - self._clock_offset
+        return time.perf_counter() - self._clock_offset
+
+    def _tick(self, frame_start, deadline):
+        """
+        Called by the timer pump: runs every command on the queue that is due,
+        until `deadline`.  Returns when the next command is due, or `None` once
+        the queue is empty.
+
+        Commands are scheduled on an absolute clock: a command with a delay of
+        30ms runs 30ms after the previous command was *due*, not 30ms after it
+        finished.  Delays that are shorter than the timer's resolution (or than
+        the time a command takes) are caught up by running several commands in
+        one timer callback, so the typing speed matches the script.  After a
+        stall of more than `MAX_LAG` the clock is reset instead, so that the
+        rest of the take isn't played back in one burst.
+        """
+        if self._scheduled is None:
+            self._scheduled = frame_start
+        elif frame_start - self._scheduled > self.MAX_LAG:
+            self._scheduled = frame_start
+
+        profile = self._profile
+        if profile is not None:
+            profile.enable()
+        if self.api_calls is not None:
+            self.api_calls.begin_frame()
+        try:
+            while self.commands:
+                now = time.perf_counter()
+                if now + 0.001 < self._scheduled or now >= deadline:
+                    break
+                self._run_next(now)
+        finally:
+            self._end_frame()
+            if self.api_calls is not None:
+                self._check_api_calls()
+            if profile is not None:
+                profile.disable()
+
+        if self.commands:
+            return self._scheduled
+        self._scheduled = None
+        self._finish_take()
+        return None
+
+    def _run_next(self, started):
         """
         Pops an item off the command queue and runs it.  The command should
         accept one argument: a cursor object, of type sublime.Region, and
         it should return `None` (no changes) or a new cursor region.
 
-        The cursors are cleared and restored between each command.
+        The director's cursor is removed from the selection before the command
+        runs and added back afterwards, see `_set_cursor`.
+
+        Every command is timed and recorded in `self.stats`.  If the
+        `trace_playback` setting is on, the timing of every command is also
+        recorded and written as a Chrome trace once the queue is empty.
         """
-        if self.commands:
-            cmd, delay = self.commands.pop(0)
-            cursor = self.target_view.get_regions('screencast_director')[0]
-            if cursor in self.target_view.sel():
-                self.target_view.sel().subtract(cursor)
-
-            info = {}
-            def what_to_do(cls, edit):
-                info['new_cursor'] = cmd(cursor, edit)
-            ScreencastDirectorCmdCommand.what_to_do = what_to_do
-            ScreencastDirector.the_director.target_view.run_command('screencast_director_cmd')
-
-            new_cursor = info['new_cursor']
-            if new_cursor is None:
-                new_cursor = cursor
-            elif isinstance(new_cursor, int):
-                new_cursor = sublime.Region(new_cursor, new_cursor)
-            elif isinstance(new_cursor, tuple):
-                new_cursor = sublime.Region(new_cursor[0], new_cursor[1])
-
-            self.target_view.sel().add(new_cursor)
-            self.target_view.add_regions('screencast_director', [new_cursor], 'source', '', sublime.HIDDEN)
-            sublime.set_timeout(self._start_timer, delay)
+        if self._trace is None and self._trace_playback:
+            self._trace = PlaybackTrace(started)
+        cmd, delay = self.commands.pop(0)
+        fragment = getattr(cmd, 'fragment', None)
+        if fragment is not None:
+            self.commands[0:0] = fragment.commands
+            return
+        if getattr(cmd, 'loop', None) is not None:
+            self.commands[0:0] = expand_loop(cmd)
+            return
+        undo_command = getattr(cmd, 'undo_command', None)
+        if undo_command is not None:
+            for target in self.targets:
+                self._switch_target(target)
+                self.target_view.run_command(undo_command)
+            self._switch_target(self.targets[0])
+            self._undo_group_open = undo_command == 'mark_undo_groups_for_gluing'
+            self._scheduled += delay / 1000.0
+            return
+        name = cmd.__name__.lstrip('_')
+        if self.api_calls is not None:
+            self.api_calls.begin(name)
+        info = self._run_on_target(cmd)
+        if len(self.targets) > 1:
+            for target in self.targets[1:]:
+                self._switch_target(target)
+                self._primary = False
+                try:
+                    self._run_on_target(cmd)
+                finally:
+                    self._primary = True
+            self._switch_target(self.targets[0])
+        if self.api_calls is not None:
+            self.api_calls.end()
+        finished = time.perf_counter()
+        self.stats.record(name, (finished - started) * 1000.0, (started - self._scheduled) * 1000.0)
+        if self._trace is not None:
+            self._trace.command(name, self._scheduled, started,
+                info['edit_start'], info['edit_stop'], finished, delay)
+        self._scheduled += delay / 1000.0
+
+    def _run_on_target(self, cmd):
+        """
+        Runs `cmd` on the current target view, and updates its cursor(s) and
+        change count.  Returns the start and end time of the edit.
+
+        The first command of a frame takes the director's cursors out of the
+        view's selection (so that its edits don't drag them along), and they
+        are put back once, by `_end_frame`.  Commands that work on the view's
+        selection (marked `needs_selection`, e.g. `run_command`) get it in
+        sync before they run, and leave it in sync.
+        """
+        needs_selection = getattr(cmd, 'needs_selection', False)
+        if needs_selection:
+            if self._frame_open:
+                self._close_frame()
+            cursor = self._pull_cursor()
+        elif not self._frame_open:
+            cursor = self._pull_cursor()
+            self._target_sel.subtract(cursor)
+            for region in self._synced_cursors:
+                self._target_sel.subtract(region)
+            self._frame_open = True
+        else:
+            cursor = self.cursor
+        self._changes = 0
+
+        info = {}
+        def what_to_do(cls, edit):
+            info['edit_start'] = time.perf_counter()
+            info['new_cursor'] = cmd(cursor, edit)
+            info['edit_stop'] = time.perf_counter()
+        ScreencastDirectorCmdCommand.what_to_do = what_to_do
+        self.target_view.run_command('screencast_director_cmd')
+
+        new_cursor = info['new_cursor']
+        if new_cursor is None:
+            new_cursor = cursor
+        elif isinstance(new_cursor, int):
+            new_cursor = sublime.Region(new_cursor, new_cursor)
+        elif isinstance(new_cursor, tuple):
+            new_cursor = sublime.Region(new_cursor[0], new_cursor[1])
+
+        self.cursor = new_cursor
+        if needs_selection:
+            self._push_cursor()
+        if self._changes is None:
+            self._change_count = self.target_view.change_count()
+            self._external_edit()
+        else:
+            self._change_count += self._changes
+        return info
+
+    def _close_frame(self):
+        self._target_sel.add(self.cursor)
+        if self.cursors:
+            self._target_sel.add_all(self.cursors)
+        self._push_cursor()
+        self._frame_open = False
+
+    def _end_frame(self):
+        """
+        Puts the cursors of every target back into its selection (and hidden
+        regions), once per frame rather than after every command.  Its API
+        calls are counted as the `end_frame` command.
+        """
+        if self.api_calls is not None:
+            self.api_calls.begin('end_frame')
+        for target in self.targets:
+            self._switch_target(target)
+            if self._frame_open:
+                self._close_frame()
+        self._switch_target(self.targets[0])
+        if self.api_calls is not None:
+            self.api_calls.end()
+
+    def _check_api_calls(self):
+        over_budget = self.api_calls.end_frame()
+        if over_budget is not None and self.api_calls.frames['over_budget'] == 1:
+            print('ScreencastDirector: a frame made {calls} API calls (budget is {budget}), '
+                'see screencast_director_stats'.format(calls=over_budget, budget=self.api_calls.budget))
+
+    def _report_name(self, kind):
+        """
+        A file name for a report about the take that just ended, e.g.
+        "trace-20240131-142502-083-w2": the time to the millisecond and the
+        window, so takes that end in the same second, or in other windows,
+        don't overwrite each other's reports.
+        """
+        now = time.time()
+        return '{kind}-{time}-{ms:03d}-w{window}'.format(kind=kind,
+            time=time.strftime('%Y%m%d-%H%M%S', time.localtime(now)),
+            ms=int(now * 1000) % 1000, window=self.window_id)
+
+    def _write_trace(self):
+        path = data_path(self._report_name('trace') + '.json')
+        self._trace.dump(path)
+        self._trace = None
+        sublime.status_message('ScreencastDirector trace written to {path}'.format(path=path))
+
+    def _start_profile(self):
+        """
+        Profiles the next take, from compiling the block until the queue is
+        empty, see `director.profiling`.  The profiling modules are only
+        imported when the `profile_playback` setting is on.
+        """
+        from .director.profiling import TakeProfile
+        self._profile = TakeProfile(get_setting('profile_top', 25))
+
+    def _write_profile(self):
+        paths = self._profile.dump(data_path(self._report_name('profile')))
+        self._profile = None
+        sublime.status_message('ScreencastDirector profile written to {path}'.format(path=paths[0]))
 
     def set_syntax(self, syntax):
         def _set_syntax(cursor, edit):
@@ -149,13 +1094,170 @@ class ScreencastDirector(object):
         self._append_command(_set_syntax)
 
     def write_parallel(self, *lines):
+        """
+        Types several `[row, col, text]` lines at the same time, one column
+        per step.  Like `write`, the text is inserted in front of what is
+        already on the rows.
+        """
+        def _layout(cursor):
+            return [(row, col, text) for (row, col, text) in lines]
         max_len = max([len(text) for (_, _, text) in lines])
-        for offset in range(0, max_len):
-            for (row, col, text) in lines:
-                if len(text) < offset:
-                    continue
-                self.goto(row, col + offset)
-                self.write(text[offset], delay_min=20, delay_max=40)
+        delays = self.delays.batch(max_len, 20, 40)
+        self._write_columns(_layout, delays, move_cursor=True, insert=True)
+
+    def _pad_rows(self, edit, widths):
+        """
+        Makes sure that every row in `widths` (`{row: width}`) exists and is at
+        least `width` characters long.  Returns `{row: point}`, the start of
+        every row in `widths`.
+        """
+        return self._write_rows(edit, dict((row, (width, '')) for row, width in widths.items()))
+
+    def _write_rows(self, edit, rows):
+        """
+        Writes `text` at `col` of every `row` in `rows` (`{row: (col, text)}`),
+        overwriting what is there, adding lines to the end of the buffer and
+        spaces to the end of short lines as needed.  Every row costs at most
+        one `replace`, and all the missing rows are added with one `insert`.
+        Returns `{row: point}`, the start of every row in `rows`.
+        """
+        view = self.target_view
+        lines = self._line_index()
+        first_row = min(rows)
+        last_row = max(rows)
+        row = min(first_row, len(lines) - 1)  # less than first_row if the buffer is too short
+        start = lines.start(row)
+        end = lines.end(min(last_row, len(lines) - 1))
+
+        edits = []
+        starts = {}
+        shift = 0
+        point = start
+        for line in view.substr(sublime.Region(start, end)).split("\n"):
+            if row in rows:
+                starts[row] = point + shift
+                col, text = rows[row]
+                if col > len(line):
+                    begin = stop = point + len(line)
+                    text = ' ' * (col - len(line)) + text
+                else:
+                    begin = point + col
+                    stop = point + min(col + len(text), len(line))
+                if text or begin != stop:
+                    edits.append((begin, stop, text))
+                    shift += len(text) - (stop - begin)
+            point += len(line) + 1
+            row += 1
+
+        if row <= last_row:
+            missing = []
+            point = end + shift
+            for row in range(row, last_row + 1):
+                col, text = rows.get(row, (0, ''))
+                text = ' ' * col + text
+                missing.append("\n" + text)
+                point += 1
+                if row in rows:
+                    starts[row] = point
+                point += len(text)
+            if edits and edits[-1][0] == end:
+                begin, stop, text = edits[-1]
+                edits[-1] = (begin, stop, text + ''.join(missing))
+            else:
+                edits.append((end, end, ''.join(missing)))
+
+        for begin, stop, text in reversed(edits):
+            if begin == stop:
+                self._insert(edit, begin, text)
+            else:
+                self._replace(edit, sublime.Region(begin, stop), text)
+        return starts
+
+    def _write_columns(self, layout, delays, move_cursor=False, insert=False):
+        """
+        Reveals a block of text one column at a time.  `layout(cursor)` is
+        called when the first column is written, and returns the `(row, col,
+        text)` lines to write.  All the short lines and missing rows are padded
+        in that first step, so every column after that is written in one edit
+        of single-character replacements that don't move any line.
+
+        With `insert`, the text is inserted in front of what is on the rows
+        instead of overwriting it: the rows are only padded up to `col`, and
+        every column shifts the lines after it (and the text after it on the
+        same row) by the characters typed so far.
+
+        `delays` has one entry per column.  The cursor stays put, unless
+        `move_cursor` is set, in which case it follows the last character.
+        """
+        infos = {}
+
+        def _prepare(info, cursor, edit):
+            self.cursors = []
+            info['lines'] = layout(cursor)
+            widths = {}
+            for row, col, text in info['lines']:
+                if text:
+                    widths[row] = max(widths.get(row, 0), col if insert else col + len(text))
+            info['widths'] = widths
+            info['starts'] = self._pad_rows(edit, widths)
+            info['typed'] = [0] * len(info['lines'])
+            info['external_changes'] = self._external_changes
+
+        def _shift(lines, typed, line):
+            # what the lines before `line` on its row have typed so far
+            row, col, _ = lines[line]
+            return sum(typed[other] for other, (other_row, other_col, _) in enumerate(lines)
+                       if other_row == row and (other_col, other) < (col, line))
+
+        def _insert_column(index, info, edit):
+            lines = info['lines']
+            starts = info['starts']
+            typed = info['typed']
+            inserts = []
+            for line, (row, col, text) in enumerate(lines):
+                if index < len(text):
+                    inserts.append((starts[row] + col + index + _shift(lines, typed, line), line))
+            # from the end, so that the points computed above stay valid
+            for point, line in sorted(inserts, reverse=True):
+                self._insert(edit, point, lines[line][2][index])
+            rows = sorted(lines[line][0] for _, line in inserts)
+            for row in starts:
+                starts[row] += bisect.bisect_left(rows, row)
+            for _, line in inserts:
+                typed[line] += 1
+            if not inserts:
+                return None
+            line = inserts[-1][1]
+            row, col, _ = lines[line]
+            return starts[row] + col + index + 1 + _shift(lines, typed, line)
+
+        def _column(index):
+            def _write_column(cursor, edit):
+                info = self._target_local(infos)
+                if 'lines' not in info:
+                    _prepare(info, cursor, edit)
+                elif info['external_changes'] != self._external_changes:
+                    # the user edited the buffer; find the rows again
+                    info['starts'] = self._pad_rows(edit, info['widths'])
+                    info['external_changes'] = self._external_changes
+
+                if insert:
+                    point = _insert_column(index, info, edit)
+                else:
+                    point = None
+                    starts = info['starts']
+                    for row, col, text in info['lines']:
+                        if index < len(text):
+                            point = starts[row] + col + index + 1
+                            self._replace(edit, sublime.Region(point - 1, point), text[index])
+                if move_cursor and point is not None:
+                    return point
+                return cursor
+            _write_column.stateful = True
+            return _write_column
+
+        for index, delay in enumerate(delays):
+            self._append_command(_column(index), delay)
 
     def write_at(self, row, col, text):
         self.goto(row, col)
@@ -172,12 +1274,6 @@ class ScreencastDirector(object):
         delay_min = options.get('delay_min', 40)
         delay_max = options.get('delay_max', 70)
 
-        def _write_letter(letter):
-            def _write(cursor, edit):
-                self.target_view.replace(edit, cursor, letter)
-                return cursor.begin() + len(letter)
-            return _write
-
         if len(what_to_write) > 1:
             def _add_newline(line):
                 if not isinstance(line, str):
@@ -188,21 +1284,167 @@ class ScreencastDirector(object):
             what_to_write = map(_add_newline, what_to_write)
 
         for entry in what_to_write:
-            previous_letter = None
             if isinstance(entry, str):
-                entry = parse(entry)
-                for letter in entry:
-                    if delay_min == delay_max:
-                        delay = delay_min
-                    elif previous_letter == letter:
-                        delay = delay_min
-                    else:
-                        delay = random.randrange(delay_min, delay_max)
-                    self._append_command(_write_letter(letter), delay=delay)
-                    previous_letter = letter
+                self._type(parse(entry), delay_min, delay_max, options.get('model'))
             else:
                 self._execute(entry)
 
+    def _type(self, text, delay_min=40, delay_max=70, model=None):
+        """
+        Adds one command per letter of `text`, with a random delay after each.
+        With the "uniform" typing model the delays are evenly spread between
+        `delay_min` and `delay_max` (repeated letters are typed faster), other
+        models pick them per bigram, see `director.typing_model`.
+        """
+        def _write_letter(letter):
+            def _write(cursor, edit):
+                return self._replace_cursors(edit, cursor, letter)
+            return _write
+
+        word_undo = self._undo_granularity == 'word'
+        if model is None:
+            model = get_setting('typing_model', 'uniform')
+        uniform = model == 'uniform'
+        if uniform:
+            delays = self.delays.batch(len(text), delay_min, delay_max)
+        else:
+            if model != 'qwerty':
+                model = self._source_path(model)
+            noise = self.delays.batch(len(text), 0, 256)
+            delays = get_model(model).delays(text, noise, delay_min, delay_max)
+        append = self.commands.append
+        previous_letter = None
+        for letter, delay in zip(text, delays):
+            if uniform and previous_letter == letter:
+                delay = delay_min
+            if word_undo and previous_letter is not None and previous_letter.isspace() and not letter.isspace():
+                # every word (and the whitespace after it) is one undo step
+                append(self._undo_marker('glue_marked_undo_groups'))
+                append(self._undo_marker('mark_undo_groups_for_gluing'))
+            append((_write_letter(letter), delay))
+            previous_letter = letter
+
+    def _type_chunked(self, text, duration, delay_min=10, delay_max=20):
+        """
+        Types `text` so that it takes about `duration` seconds, no matter how
+        long it is.  Short texts are typed one letter at a time, like `_type`;
+        longer ones a word, or a line, per step.  The size of each chunk is
+        decided when it is typed, from the text and the time that are left, so
+        a slow editor shortens the remaining steps instead of overrunning.
+        Time is measured with `_playback_time`, so pausing doesn't use it up.
+        """
+        state = {'pos': 0, 'deadline': None}
+        average_delay = (delay_min + delay_max) / 2000.0
+
+        def _write_chunk(cursor, edit):
+            if self._primary:
+                now = self._playback_time()
+                if state['deadline'] is None:
+                    state['deadline'] = now + duration
+                start = state['pos']
+                steps_left = max(1, int((state['deadline'] - now) / average_delay))
+                size = int(math.ceil((len(text) - start) / float(steps_left)))
+                state['pos'] = _chunk_end(text, start, size)
+                state['chunk'] = text[start:state['pos']]
+            cursor = self._replace_cursors(edit, cursor, state['chunk'])
+            if state['pos'] < len(text):
+                self._splice(lambda: self._append_command(_write_chunk, delay=self.delays.randint(delay_min, delay_max)))
+            return cursor
+        _write_chunk.expands = True
+        _write_chunk.stateful = True
+        self._append_command(_write_chunk, delay=self.delays.randint(delay_min, delay_max))
+
+    def transform_to(self, *args, **options):
+        """
+        Edits the target view until it contains the given text, by selecting,
+        deleting and typing only what changed.  The text can be inline, or the
+        name of a file (relative to the source file):
+
+            - transform_to: "the new contents"
+            - transform_to: {file: version_b.py, delay_min: 20, delay_max: 40}
+
+        The diff is computed when the command is played, against whatever the
+        target view contains at that time.  Options: `delay_min`/`delay_max`
+        (typing speed), `select_delay` (pause after selecting text that is
+        about to be deleted) and `typing: false` (insert each change at once).
+        """
+        if len(args) == 1 and isinstance(args[0], dict):
+            return self.transform_to(**args[0])
+        if args:
+            text = args[0]
+        elif 'file' in options:
+            path = self._source_path(options['file'])
+            assert os.path.isfile(path), 'transform_to: there is no file {path}'.format(path=path)
+            with open(path) as f:
+                text = f.read()
+        else:
+            text = options['text']
+        delay_min = options.get('delay_min', 40)
+        delay_max = options.get('delay_max', 70)
+        select_delay = options.get('select_delay', 400)
+        typing = options.get('typing', True)
+
+        def _transform_to(cursor, edit):
+            self.cursors = []
+            old = self.target_view.substr(sublime.Region(0, self.target_view.size()))
+            self._splice(lambda: self._compile_transform(old, text, delay_min, delay_max, select_delay, typing, options.get('model')))
+            return cursor
+        if 'file' in options:
+            # the file may change between plays, don't share it in a fragment
+            _transform_to.stateful = True
+        self._append_command(_transform_to, 0)
+
+    def _compile_transform(self, old, new, delay_min, delay_max, select_delay, typing, model):
+        old_lines = old.split("\n")
+        new_lines = new.split("\n")
+        old_starts = _line_starts(old_lines)
+        new_starts = _line_starts(new_lines)
+
+        def _move_to(point):
+            def _transform_move(cursor, edit):
+                return point
+            return _transform_move
+
+        def _select(begin, end):
+            def _transform_select(cursor, edit):
+                return (begin, end)
+            return _transform_select
+
+        shift = 0
+        for a_start, a_end, b_start, b_end in diff(old_lines, new_lines):
+            old_begin, old_end = old_starts[a_start], old_starts[a_end]
+            new_begin, new_end = new_starts[b_start], new_starts[b_end]
+            if a_end == len(old_lines):
+                # there is no newline after the last line; take the one before it
+                old_begin, old_end = max(0, old_begin - 1), old_end - 1
+                new_begin, new_end = max(0, new_begin - 1), new_end - 1
+            removed = old[old_begin:old_end]
+            inserted = new[new_begin:new_end]
+
+            # only touch the characters that changed
+            prefix = 0
+            length = min(len(removed), len(inserted))
+            while prefix < length and removed[prefix] == inserted[prefix]:
+                prefix += 1
+            suffix = 0
+            length -= prefix
+            while suffix < length and removed[-1 - suffix] == inserted[-1 - suffix]:
+                suffix += 1
+            removed = removed[prefix:len(removed) - suffix]
+            inserted = inserted[prefix:len(inserted) - suffix]
+
+            point = old_begin + prefix + shift
+            self._append_command(_move_to(point))
+            if removed:
+                self._append_command(_select(point, point + len(removed)), select_delay)
+                self.delete()
+            if inserted:
+                if typing:
+                    self._type(inserted, delay_min, delay_max, model)
+                else:
+                    self.insert(inserted)
+            shift += len(inserted) - len(removed)
+
     def write_inside(self, left, middle=None, right=None, *others):
         """
         You can use this one of three ways:
@@ -231,8 +1473,7 @@ class ScreencastDirector(object):
 
         def _write_letters(a, b):
             def _write(cursor, edit):
-                self.target_view.replace(edit, cursor, a + b)
-                return cursor.begin() + len(a)
+                return self._replace_cursors(edit, cursor, a + b, len(a))
             return _write
 
         index = len(right)
@@ -254,70 +1495,163 @@ class ScreencastDirector(object):
 
     def insert(self, what_to_write, delay=None):
         def _insert(cursor, edit):
-            self.target_view.replace(edit, cursor, what_to_write)
-            return cursor.begin() + len(what_to_write)
+            return self._replace_cursors(edit, cursor, what_to_write)
         self._append_command(_insert, delay)
 
     def _write_at(self, edit, row, col, text):
-        # support multiple lines
+        """
+        Writes `text` at `row`, `col`, adding lines and spaces as needed.  Every
+        line of `text` is written at `col` of the following rows.  Returns the
+        point after the last character.
+        """
         if "\n" in text:
             lines = text.splitlines()
-            for i, line in enumerate(lines):
-                self._write_at(edit, row + i, col, line)
-            return
+        else:
+            lines = [text]
+        starts = self._write_rows(edit, dict((row + index, (col, line)) for index, line in enumerate(lines)))
+        return starts[row + len(lines) - 1] + col + len(lines[-1])
 
-        # fix number of rows
-        actual_row, _ = self.target_view.rowcol(self.target_view.text_point(row, 0))
-        nl = max(0, row - actual_row)
-        if nl:
-            point = self.target_view.text_point(actual_row, 0)
-            eol_point = self.target_view.line(point).end()
-            self.target_view.insert(edit, eol_point, "\n" * nl)
-        # fix column
-        line = self.target_view.line(self.target_view.text_point(row, 0))
-        spaces = max(0, col + len(text) - len(line))
-        if spaces:
-            point = line.end()
-            self.target_view.insert(edit, point, ' ' * spaces)
-        # k, we should be good to go now
-        point = self.target_view.text_point(row, col)
-        self.target_view.replace(edit, sublime.Region(point, point + len(text)), text)
-        return point + len(text)
+    def write_block_at(self, row, col, text, delay=None):
+        """
+        Writes a block of text at `row`, `col` in one step; every line of `text`
+        starts at `col`.  This is the same as `insert_at`, but with a `delay`.
+        """
+        def _write_block_at(cursor, edit):
+            self.cursors = []
+            return self._write_at(edit, row, col, text)
+        self._append_command(_write_block_at, delay)
 
     def write_lines(self, *lines, **options):
+        """
+        Reveals `lines` one column at a time, starting at the cursor.
+        """
         if len(lines) == 1 and isinstance(lines[0], dict):
             return self.write_lines(*lines[0]['lines'], **lines[0])
         delay = options.get('delay', 20)
 
-        def func_maker(char, line_index, char_index):
-            def _write_char(cursor, edit):
-                row, col = self.target_view.rowcol(cursor.begin())
-                line_row = row + line_index
-                line_col = col + char_index
-                self._write_at(edit, line_row, line_col, char)
-                return cursor.begin()
-            return _write_char
-
-        info = {'index': 0}
+        def _layout(cursor):
+            row, col = self.target_view.rowcol(cursor.begin())
+            return [(row + index, col, line) for index, line in enumerate(lines)]
         longest_line_len = reduce(lambda a, b: max(a, len(b)), lines, 0)
-        while info['index'] < longest_line_len:
-            for line_index, line in enumerate(lines):
-                try:
-                    char = line[info['index']]
-                    char_index = info['index']
-                    fn = func_maker(char, line_index, char_index)
-                    self._append_command(fn, 0)
-                except IndexError:
-                    pass
-            info['index'] += 1
-            self.delay(delay)
+        self._write_columns(_layout, [delay] * longest_line_len)
 
     def nl(self, delay=None):
         def _nl(cursor, edit):
-            self.target_view.replace(edit, cursor, "\n")
-            return cursor.begin() + 1
+            return self._replace_cursors(edit, cursor, "\n")
         self._append_command(_nl, delay)
 
+    def include(self, target):
+        """
+        Plays a block of another director file (relative to this one), or all
+        of its blocks.  Blocks are counted from 0:
+
+            - include: common.yaml#2
+            - include: intro.yaml
+
+        The included blocks are compiled the first time, and reused until the
+        file changes.  Macros that they define can be called afterwards.
+        """
+        path, _, block = target.partition('#')
+        path = self._source_path(path)
+        assert os.path.isfile(path), 'include: there is no file {path}'.format(path=path)
+        key = ('include', path, os.path.getmtime(path), block)
+        assert key not in self._including, 'include: {target} includes itself'.format(target=target)
+        self._including.add(key)
+        try:
+            fragment = self.fragments.get(key, lambda: self._collect(lambda: self._execute_all(self._included_entries(path, block))))
+        finally:
+            self._including.discard(key)
+        self._append_fragment(fragment)
+
+    def _included_entries(self, path, block):
+        with open(path) as f:
+            source = f.read()
+        blocks = [source[start:end] for start, end in split_blocks(source)]
+        if block:
+            assert block.isdigit() and int(block) < len(blocks), \
+                'include: {path} has no block #{block}'.format(path=path, block=block)
+            blocks = [blocks[int(block)]]
+        entries = []
+        for content in blocks:
+            entries.extend(load_yaml(content) or [])
+        return entries
+
+    def _execute_all(self, entries):
+        for entry in entries:
+            self._execute(entry)
+
+    def macro(self, name, params=None, do=None):
+        """
+        Defines a macro, a list of commands that can be played with `call`.
+        `{param}` in any string is replaced by the value passed to `call`.
+        `params` is a list of names, or a dict of names and default values:
+
+            - macro:
+                name: function
+                params: {name: null, doc: TODO}
+                do:
+                  - write: "def {name}():\\n"
+                  - write: "    # {doc}\\n"
+
+        Macros belong to the session, so they can be defined in one block (or
+        an included file) and called from any block after that.
+        """
+        if isinstance(name, dict):
+            return self.macro(**name)
+        if params is None:
+            params = {}
+        elif isinstance(params, list):
+            params = dict((param, None) for param in params)
+        self._macro_version += 1
+        self.macros[name] = (params, do or [], self._macro_version)
+
+    def call(self, macro, **params):
+        """
+        Plays a macro, see `macro`:
+
+            - call: {macro: function, name: main, doc: Runs the thing.}
+            - call: blank_line
+
+        Every macro and set of arguments is compiled once, and reused.
+        """
+        if isinstance(macro, dict):
+            return self.call(**macro)
+        name = macro
+        assert name in self.macros, 'call: there is no macro called {name}'.format(name=name)
+        defaults, body, version = self.macros[name]
+        values = dict(defaults)
+        values.update(params)
+        missing = [param for param, value in values.items() if value is None]
+        assert not missing, 'call: {name} needs {missing}'.format(name=name, missing=', '.join(sorted(missing)))
+        key = ('call', name, version, repr(sorted(values.items())))
+        assert key not in self._including, 'call: {name} calls itself'.format(name=name)
+        self._including.add(key)
+        try:
+            fragment = self.fragments.get(key, lambda: self._collect(lambda: self._execute_all(substitute(body, values))))
+        finally:
+            self._including.discard(key)
+        self._append_fragment(fragment)
+
+    def repeat(self, times, do=None):
+        """
+        Plays a list of commands `times` times:
+
+            - repeat:
+                times: 500
+                do:
+                  - nl
+                  - delay: 20
+
+        The commands are compiled once, and the loop is expanded one play at a
+        time during playback, so a long loop doesn't fill up the queue.
+        """
+        if isinstance(times, dict):
+            return self.repeat(**times)
+        body = do or []
+        if times > 0:
+            loop = Loop(times, lambda: self._collect(lambda: self._execute_all(body)))
+            self.commands.append(loop_entry(loop, times))
+
     def delay(self, delay=100):
         def _delay(cursor, edit):
             return cursor
@@ -326,47 +1660,130 @@ class ScreencastDirector(object):
     def go(self, where, delay=None):
         def _go(cursor, edit):
             cursor = cursor.begin() + where
+            self._move_cursors(lambda region: sublime.Region(region.begin() + where))
             self.target_view.sel().clear()
-            self.target_view.sel().add(sublime.Region(cursor, cursor))
             return cursor
         self._append_command(_go, delay)
 
     def select_all(self, delay=None):
         def _select_all(cursor, edit):
+            self.cursors = []
             allofit = sublime.Region(0, self.target_view.size())
             self.target_view.sel().clear()
-            self.target_view.sel().add(allofit)
             return allofit
         self._append_command(_select_all, delay)
 
     def select_delta(self, delta, delay=None):
         def _select_delta(cursor, edit):
+            self._move_cursors(lambda region: sublime.Region(region.begin(), region.end() + delta))
             selection = sublime.Region(cursor.begin(), cursor.end() + delta)
             self.target_view.sel().clear()
-            self.target_view.sel().add(selection)
             return selection
         self._append_command(_select_delta, delay)
 
     def select_eol(self, delay=None):
         def _select_eol(cursor, edit):
+            self._move_cursors(lambda region: sublime.Region(region.begin(), self.target_view.line(region.a).end()))
             selection = sublime.Region(cursor.begin(), self.target_view.line(cursor.a).end())
             self.target_view.sel().clear()
-            self.target_view.sel().add(selection)
             return selection
         self._append_command(_select_eol, delay)
 
-    def select_next(self, find_next, delay=None):
-        def _select_delta(cursor, edit):
-            selection = self.target_view.find(find_next, cursor.begin(), sublime.LITERAL)
+    def select_next(self, find_next, delay=None, **options):
+        """
+        Selects the next occurrence of `find_next`, starting at the cursor.
+        With `all: true`, every occurrence is selected, with one cursor each.
+
+            - select_next: needle
+            - select_next: {find: needle, all: true}
+        """
+        if isinstance(find_next, dict):
+            options = dict(find_next)
+            return self.select_next(options.pop('find'), **options)
+        self._search.add_pattern(find_next)
+        find_all = options.get('all', False)
+
+        def _select_next(cursor, edit):
+            self.cursors = []
+            positions = self._occurrences(find_next)
+            index = bisect.bisect_left(positions, cursor.begin())
+            if find_all and positions:
+                index = index % len(positions)
+                self.cursors = [sublime.Region(point, point + len(find_next)) for point in positions]
+                del self.cursors[index]
+            elif index == len(positions):
+                return cursor
+            selection = sublime.Region(positions[index], positions[index] + len(find_next))
             self.target_view.sel().clear()
-            self.target_view.sel().add(selection)
             return selection
-        self._append_command(_select_delta, delay)
+        self._append_command(_select_next, delay)
+
+    def select_nth(self, find, n, delay=None):
+        """
+        Selects the `n`th occurrence of `find` in the target view (the first one
+        is `1`, the last one is `-1`).
+        """
+        self._search.add_pattern(find)
+
+        def _select_nth(cursor, edit):
+            self.cursors = []
+            positions = self._occurrences(find)
+            index = n - 1 if n > 0 else len(positions) + n
+            if not 0 <= index < len(positions):
+                return cursor
+            selection = sublime.Region(positions[index], positions[index] + len(find))
+            self.target_view.sel().clear()
+            return selection
+        self._append_command(_select_nth, delay)
+
+    def replace_all(self, find, replace='', **options):
+        """
+        Replaces every occurrence of `find`, from the top: each one is selected,
+        and then the replacement is typed over it.  Without a replacement the
+        occurrences are deleted.
+
+            - replace_all: [old_name, new_name]
+            - replace_all: {find: old_name, replace: new_name, select_delay: 300}
+        """
+        if isinstance(find, dict):
+            options = dict(find)
+            return self.replace_all(options.pop('find'), options.pop('replace', ''), **options)
+        if replace is None:
+            replace = ''  # `replace: ` with nothing after it
+        self._search.add_pattern(find)
+        delay_min = options.get('delay_min', 40)
+        delay_max = options.get('delay_max', 70)
+        select_delay = options.get('select_delay', 300)
+
+        def _select(begin, end):
+            def _replace_all_select(cursor, edit):
+                return (begin, end)
+            return _replace_all_select
+
+        def _compile(positions):
+            shift = 0
+            previous_end = 0
+            for point in positions:
+                if point < previous_end:
+                    continue  # overlaps the previous occurrence
+                previous_end = point + len(find)
+                self._append_command(_select(point + shift, point + shift + len(find)), select_delay)
+                if replace:
+                    self._type(replace, delay_min, delay_max, options.get('model'))
+                else:
+                    self.delete()
+                shift += len(replace) - len(find)
+
+        def _replace_all(cursor, edit):
+            self.cursors = []
+            positions = list(self._occurrences(find))
+            self._splice(lambda: _compile(positions))
+            return cursor
+        self._append_command(_replace_all, 0)
 
     def delete(self, delay=None):
         def _delete(cursor, edit):
-            self.target_view.replace(edit, cursor, '')
-            return cursor.begin()
+            return self._replace_cursors(edit, cursor, '')
         self._append_command(_delete, delay)
 
     def clear(self, delay=None):
@@ -376,23 +1793,20 @@ class ScreencastDirector(object):
 
     def select_lines(self, line_a, line_b, delay=None):
         def _select_lines(cursor, edit):
-            last_row = self.target_view.rowcol(len(self.target_view))[0] + 1
+            self.cursors = []
+            lines = self._line_index()
             row_a = line_a
             row_b = line_b
             if row_a < 0:
-                row_a = last_row + row_a
+                row_a = len(lines) + row_a
             if row_b < 0:
-                row_b = last_row + row_b
-            point_a = self.target_view.text_point(row_a, 0)
-            point_b = self.target_view.text_point(row_b, 0)
+                row_b = len(lines) + row_b
             # return if the lines are unreachable
-            if self.target_view.rowcol(point_a)[0] != line_a:
+            if not 0 <= row_a < len(lines):
                 return cursor.a
-            start = self.target_view.full_line(point_a).begin()
-            stop = self.target_view.full_line(point_b).end()
-            selection = sublime.Region(start, stop)
+            row_b = max(0, min(row_b, len(lines) - 1))
+            selection = sublime.Region(lines.start(row_a), lines.full_end(row_b))
             self.target_view.sel().clear()
-            self.target_view.sel().add(selection)
             return selection
         self._append_command(_select_lines, delay)
 
@@ -401,37 +1815,60 @@ class ScreencastDirector(object):
         self.delete(delay)
 
     def insert_at(self, row, col, text):
-        def _insert(cursor, edit):
+        def _insert_at(cursor, edit):
+            self.cursors = []
             return self._write_at(edit, row, col, text)
-        self._append_command(_insert, 0)
+        self._append_command(_insert_at, 0)
 
     def goto_eol(self):
         def _goto_eol(cursor, edit):
+            self._move_cursors(lambda region: sublime.Region(self.target_view.line(region.a).end()))
             cursor = sublime.Region(self.target_view.line(cursor.a).end())
             self.target_view.sel().clear()
-            self.target_view.sel().add(cursor)
             return cursor
         self._append_command(_goto_eol, 0)
 
     def goto(self, row, col):
         self.insert_at(row, col, '')
 
-    def add_cursor(self, row, col):
+    def add_cursor(self, row, col, delay=None):
+        """
+        Adds a cursor at `row`, `col` (adding lines and spaces if needed).  The
+        typing commands (`write`, `insert`, `nl`, `delete`, `write_inside`)
+        edit every cursor at once, `go`, `select_delta`, `select_eol` and
+        `goto_eol` move every cursor, and the other movement commands drop the
+        extra cursors.
+        """
         def _add_cursor(cursor, edit):
+            size = self.target_view.size()
+            point = self._write_at(edit, row, col, '')
+            padding = self.target_view.size() - size
+            if padding:
+                # the lines and spaces were inserted just before `point`
+                start = point - padding
+
+                def _shift(region):
+                    if region.begin() > start:
+                        return sublime.Region(region.a + padding, region.b + padding)
+                    return region
+                self.cursors = [_shift(region) for region in self.cursors]
+                cursor = _shift(cursor)
+            self.cursors.append(sublime.Region(point, point))
             return cursor
-        self.insert_at(row, col, '')
+        self._append_command(_add_cursor, delay)
+
+    def clear_cursors(self, delay=None):
+        def _clear_cursors(cursor, edit):
+            self.cursors = []
+            return cursor
+        self._append_command(_clear_cursors, delay)
 
     def set_mark(self, name=None, delay=None):
         if not name:
             name = '__tmp__'
 
         def _set_mark(cursor, edit):
-            cursor_0 = self.target_view.line(cursor.begin()).a
-            self._mark_offsets[name] = cursor.begin() - cursor_0
-            if self._mark_offsets[name] == 0:
-                self._mark_offsets[name] = 1
-                cursor_0 -= 1
-            self.target_view.add_regions('screencast_director_%s' % name, [sublime.Region(cursor_0, cursor_0)], 'source', '', sublime.HIDDEN)
+            self.marks.set(name, cursor.begin())
             return cursor
         self._append_command(_set_mark, delay)
 
@@ -440,88 +1877,60 @@ class ScreencastDirector(object):
             name = '__tmp__'
 
         def _goto_mark(cursor, edit):
-            cursors = self.target_view.get_regions('screencast_director_%s' % name)
-            return cursors[0].a + self._mark_offsets[name]
+            self.cursors = []
+            return self.marks.get(name, cursor)
         self._append_command(_goto_mark, delay)
 
     def select_from_mark(self, name=None, delay=None):
-        if not self._mark_offsets:
-            return
-
         if not name:
             name = '__tmp__'
 
         def _select_from_mark(cursor, edit):
-            cursors = self.target_view.get_regions('screencast_director_%s' % name)
-            a = cursors[0].a + self._mark_offsets[name]
-            b = cursor.b
-            return a, b
+            if name not in self.marks:
+                return cursor
+            self.cursors = []
+            return self.marks.get(name), cursor.b
         self._append_command(_select_from_mark, delay)
 
     def clear_marks(self, delay=None):
         def _clear_marks(cursor, edit):
-            for name in self._mark_offsets:
-                self.target_view.erase_regions('screencast_director_%s' % name)
-            self._mark_offsets = {}
+            self.marks.clear()
             return cursor
         self._append_command(_clear_marks, delay)
 
     def run_command(self, command, args=None):
         def _run_command(cursor, edit):
-            self.target_view.sel().add(cursor)
+            self.cursors = []
             if args is None:
                 self.target_view.run_command(command)
             else:
                 self.target_view.run_command(command, args)
+            self._unknown_changes()
             cursor = self.target_view.sel()[0]
             return cursor
+        _run_command.needs_selection = True
         self._append_command(_run_command)
 
-ScreencastDirector.the_director = ScreencastDirector()
+pump = TimerPump(sublime.set_timeout)
 
 
 class ScreencastDirectorBindSourceCommand(sublime_plugin.ApplicationCommand):
     def run(self):
         window = sublime.active_window()
-        source_view = ScreencastDirector.the_director.source_view = window.active_view()
+        director = ScreencastDirector.for_window(window)
+        source_view = director.source_view = window.active_view()
         if source_view is not None:
-            ScreencastDirector.the_director.index = 0
+            director.index = 0
 
             source_view.sel().clear()
             allofit = sublime.Region(0, source_view.size())
             source = source_view.substr(allofit)
-            search = "\n\n-"
-            parts = source.split(search)
-
-            blocks = []
-
-            skip = parts.pop(0)
-            if len(skip) and skip[0] == "-":
-                blocks.append(sublime.Region(0, len(skip.rstrip())))
-
-            offset = len(skip)
-
-            for part in parts:
-                offset += len(search) - 1
-                start = offset
-                offset += 1
-                end = offset + len(part.rstrip())
-                offset += len(part)
-                region = sublime.Region(start, end)
-                blocks.append(region)
-            if not blocks:
+            if not director._bind_blocks(source):
                 self.view.show_popup('ScreencastDirector could not parse commands.')
                 return
-            source_view.add_regions(
-                'screencast_director',
-                blocks,
-                'source',
-                '',
-                sublime.DRAW_OUTLINED
-                )
 
             self.view.show_popup('Bound source view and set index to 0')
-            ScreencastDirector.the_director._refresh_source()
+            director._refresh_source()
 
 
 class ScreencastDirectorCmdCommand(sublime_plugin.TextCommand):
@@ -530,68 +1939,244 @@ class ScreencastDirectorCmdCommand(sublime_plugin.TextCommand):
 
 
 class ScreencastDirectorBindTargetCommand(sublime_plugin.WindowCommand):
-    def run(self):
-        window = sublime.active_window()
-        ScreencastDirector.the_director.target_view = window.active_view()
-        self.view.show_popup('Bound target view')
-        ScreencastDirector.the_director._refresh_source()
+    """
+    Binds the active view as the target view.  With `{"add": true}` it is
+    added to the target views instead, and every block is played onto all of
+    them at the same time.  The source view can't be a target.
+    """
+    def run(self, add=False):
+        window = self.window
+        director = ScreencastDirector.for_window(window)
+        view = window.active_view()
+        source_view = director.source_view
+        if view is None or source_view is not None and view.id() == source_view.id():
+            window.status_message('ScreencastDirector: the source view can\'t be a target, choose another view')
+            return
+        director.bind_target(view, add)
+        if len(director.targets) > 1:
+            window.status_message('Bound {count} target views'.format(count=len(director.targets)))
+        else:
+            window.status_message('Bound target view')
+        director._refresh_source()
 
 
 class ScreencastDirectorPasteCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         target_view = self.view
-        ScreencastDirector.the_director.target_view = target_view
-        ScreencastDirector.the_director.write(sublime.get_clipboard(),
-            delay_min=10,
-            delay_max=20,
-            )
-        region = self.view.sel()[0]
-        target_view.add_regions('screencast_director', [region], 'source', '', sublime.HIDDEN)
-        ScreencastDirector.the_director._start_timer()
+        director = ScreencastDirector.for_window(target_view.window())
+        if all(director._view_of(target) is None or director._view_of(target).id() != target_view.id()
+                for target in director.targets):
+            director.bind_target(target_view)
+        director._switch_target(director.targets[0])
+        director._update_api_calls()
+        director._undo_granularity = get_setting('undo_granularity', 'command')
+        director._seed_delays(-1)
+        text = sublime.get_clipboard()
+        duration = get_setting('paste_duration', 20)
+        if len(text) > get_setting('paste_chunk_threshold', 2000) or len(text) * 0.015 > duration:
+            director._execute_undoable({'_type_chunked': [text, duration]})
+        else:
+            director._execute_undoable({'write': {
+                'write': text,
+                'delay_min': 10,
+                'delay_max': 20,
+                }})
+        director._set_target_cursors()
+        director._start_timer()
 
 
 class ScreencastDirectorRunCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         window = sublime.active_window()
-        source_view = ScreencastDirector.the_director.source_view
-        target_view = ScreencastDirector.the_director.target_view
+        director = ScreencastDirector.for_window(window)
+        source_view = director.source_view
+        target_view = director.target_view
         if target_view is None:
             window.run_command('screencast_director_bind_target')
-            target_view = ScreencastDirector.the_director.target_view
+            target_view = director.target_view
 
         if source_view is None:
             self.view.show_popup('Choose your source view')
             return
 
-        if target_view.id() == source_view.id():
-            ScreencastDirector.the_director.target_view = None
+        if target_view is None or target_view.id() == source_view.id():
+            director.target_view = None
             self.view.show_popup('Choose your target view')
             return
 
-        ScreencastDirector.the_director.command = self
-        ScreencastDirector.the_director._run()
-        ScreencastDirector.the_director.index += 1
-        ScreencastDirector.the_director._refresh_source()
-        sublime.status_message('Index is at {index}'.format(index=ScreencastDirector.the_director.index))
+        director.command = self
+        director._run()
+        director.index += 1
+        director._refresh_source()
+        sublime.status_message('Index is at {index}, take plays for {seconds:.1f}s'.format(
+            index=director.index, seconds=director.time_left()))
 
 
 class ScreencastDirectorNextCommand(sublime_plugin.ApplicationCommand):
     def run(self):
-        if ScreencastDirector.the_director.source_view is None:
+        director = ScreencastDirector.for_window()
+        if director.source_view is None:
             window = sublime.active_window()
             window.run_command('screencast_director_bind_source')
         else:
-            ScreencastDirector.the_director.index += 1
-        ScreencastDirector.the_director._refresh_source()
-        sublime.status_message('Index is at {index}'.format(index=ScreencastDirector.the_director.index))
+            director.index += 1
+        director._refresh_source()
+        sublime.status_message('Index is at {index}'.format(index=director.index))
+
+
+class ScreencastDirectorPauseCommand(sublime_plugin.ApplicationCommand):
+    def run(self):
+        director = ScreencastDirector.for_window()
+        director.pause()
+        sublime.status_message('ScreencastDirector {state}, {seconds:.1f}s left'.format(
+            state='paused' if director._paused else 'resumed', seconds=director.time_left()))
+
+
+class ScreencastDirectorSeekCommand(sublime_plugin.ApplicationCommand):
+    """
+    Skips `offset` milliseconds ahead in the take that is playing.
+    """
+    def run(self, offset):
+        ScreencastDirector.for_window().seek(offset)
+
+
+class ScreencastDirectorStatsCommand(sublime_plugin.ApplicationCommand):
+    """
+    Shows the per-command playback counters in an output panel.  Pass
+    `{"reset": true}` to clear them between takes.
+    """
+    def run(self, reset=False):
+        director = ScreencastDirector.for_window()
+        if reset:
+            director.stats.reset()
+            if director.api_calls is not None:
+                director.api_calls.reset()
+            sublime.status_message('ScreencastDirector stats reset')
+            return
+
+        report = director.stats.report()
+        if director.api_calls is not None:
+            report += '\n' + director.api_calls.report()
+        window = sublime.active_window()
+        panel = window.create_output_panel('screencast_director')
+        panel.run_command('append', {'characters': report})
+        window.run_command('show_panel', {'panel': 'output.screencast_director'})
 
 
 class ScreencastDirectorPreviousCommand(sublime_plugin.ApplicationCommand):
     def run(self):
-        if ScreencastDirector.the_director.source_view is None:
+        director = ScreencastDirector.for_window()
+        if director.source_view is None:
             window = sublime.active_window()
             window.run_command('screencast_director_bind_source')
         else:
-            ScreencastDirector.the_director.index -= 1
-        ScreencastDirector.the_director._refresh_source()
-        sublime.status_message('Index is at {index}'.format(index=ScreencastDirector.the_director.index))
+            director.index -= 1
+        director._refresh_source()
+        sublime.status_message('Index is at {index}'.format(index=director.index))
+
+
+class ScreencastDirectorRecordCommand(sublime_plugin.TextCommand):
+    """
+    Starts recording the edits and cursor moves in this view, or stops and
+    writes them out as a block of director commands: appended to the source
+    view if one is bound, otherwise in a new view.
+    """
+    def run(self, edit):
+        view = self.view
+        recorder = ScreencastDirector.recorders.pop(view.id(), None)
+        if recorder is None:
+            selection = view.sel()[0]
+            ScreencastDirector.recorders[view.id()] = Recorder(
+                view.size(), (selection.a, selection.b), time.perf_counter())
+            sublime.status_message('ScreencastDirector is recording')
+            return
+
+        events = list(recorder.events)
+        window = view.window()
+        sublime.status_message('ScreencastDirector recorded {count} events'.format(count=len(events)))
+
+        def write_block():
+            entries = compact(events, recorder.start)
+            if not entries:
+                sublime.set_timeout(lambda: sublime.status_message('ScreencastDirector recorded nothing'), 0)
+                return
+            block = dump_yaml(entries)
+            sublime.set_timeout(lambda: self._deliver(window, block), 0)
+        sublime.set_timeout_async(write_block, 0)
+
+    def _deliver(self, window, block):
+        director = ScreencastDirector.for_window(window)
+        source_view = director._source_view
+        if source_view is None or source_view.window() is None:
+            source_view = window.new_file()
+            source_view.set_name('Recording')
+        else:
+            block = '\n\n' + block
+        source_view.run_command('append', {'characters': block})
+
+    def is_checked(self):
+        return self.view.id() in ScreencastDirector.recorders
+
+
+control_server = None
+
+
+def _dispatch_control(message):
+    """
+    Called from the control server's threads; runs `message` on the main
+    thread.
+    """
+    sublime.set_timeout(lambda: _run_control(message), 0)
+
+
+def _run_control(message):
+    command = message['command']
+    if command == 'run':
+        sublime.active_window().active_view().run_command('screencast_director_run')
+    elif command == 'seek':
+        sublime.run_command('screencast_director_seek', {'offset': message['offset']})
+    else:
+        sublime.run_command('screencast_director_' + command)
+
+
+def plugin_loaded():
+    global control_server
+    address = get_setting('control_socket')
+    if address is not None:
+        try:
+            control_server = ControlServer(address, _dispatch_control)
+        except (OSError, AssertionError) as e:
+            print('ScreencastDirector: could not listen on {address!r}: {error}'.format(address=address, error=e))
+            sublime.status_message('ScreencastDirector control channel is off, see the console')
+            return
+        control_server.start()
+
+
+def plugin_unloaded():
+    global control_server
+    if control_server is not None:
+        control_server.stop()
+        control_server = None
+
+
+class ScreencastDirectorListener(sublime_plugin.EventListener):
+    """
+    Reloads the blocks of a source view when it is edited, so it doesn't have
+    to be bound again, and feeds edits to the views that are being recorded.
+    """
+    def on_modified(self, view):
+        view_id = view.id()
+        recorder = ScreencastDirector.recorders.get(view_id)
+        if recorder is not None:
+            selection = view.sel()[0]
+            recorder.modified(time.perf_counter(), view.size(), (selection.a, selection.b),
+                lambda begin, end: view.substr(sublime.Region(begin, end)))
+        for director in ScreencastDirector.sessions.values():
+            if director._source_view is not None and director._source_view.id() == view_id:
+                director._source_modified()
+
+    def on_selection_modified(self, view):
+        recorder = ScreencastDirector.recorders.get(view.id())
+        if recorder is not None:
+            selection = view.sel()[0]
+            recorder.selected(time.perf_counter(), (selection.a, selection.b))